@@ -21,25 +21,113 @@ from pprint import pprint
 import\
     ucoin, json, logging, argparse, sys,\
     gnupg, hashlib, re, datetime as dt,\
-    webbrowser, math
+    webbrowser, math, base64, itertools
 from collections import OrderedDict
 from flask import\
     Flask, request, render_template,\
     jsonify, redirect, abort, url_for,\
-    flash, Blueprint
+    flash, Blueprint, Response
 from io import StringIO
-from werkzeug.contrib.cache import SimpleCache
+from core.singleflight import flights
 
 logger = logging.getLogger("api")
 
 bp = Blueprint('api', __name__, static_folder='static', template_folder='templates')
-cache = SimpleCache()
 
-def render_prettyprint(template_name, result):
+FORMATS = OrderedDict([('json', 'application/json'),
+                       ('ndjson', 'application/x-ndjson'),])
+
+def get_format():
+    """returns json or ndjson when asked by the format argument or the Accept header, None for the HTML page"""
+
+    if request.args.get('format') in FORMATS:
+        return request.args['format']
+
+    best = request.accept_mimetypes.best_match(['text/html'] + list(FORMATS.values()))
+    for format, mimetype in FORMATS.items():
+        if best == mimetype: return format
+    return None
+
+def is_stream(result):
+    """returns whether a result is a sequence of items, a generator of a ucoin resource for instance"""
+
+    return hasattr(result, '__iter__') and not isinstance(result, (dict, str, bytes))
+
+def stream(format, result):
+    """yields the chunks of a result as a JSON document or as one JSON document per line, items being encoded as they arrive"""
+
+    if format == 'ndjson':
+        for item in (result if is_stream(result) else [result]):
+            yield json.dumps(item) + '\n'
+        return
+
+    if not is_stream(result):
+        yield json.dumps(result)
+        return
+
+    separator = '['
+    for item in result:
+        yield separator + json.dumps(item)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+def encode_cursor(leaf):
+    return base64.urlsafe_b64encode(('h:%s' % leaf).encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        prefix, leaf = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split(':')
+        if prefix != 'h' or not re.fullmatch(r'[0-9A-Fa-f]+', leaf): raise ValueError(cursor)
+    except ValueError:
+        abort(400)
+    return leaf
+
+def paginate(resource, path, *args):
+    """returns the items of the page asked by the limit and cursor arguments with the cursor of the next page, None if it is the last one
+
+    The cursor is the hash of the last leaf of the previous page, the page
+    beginning after it in the leaves of the resource, so that leaves added
+    or removed before it do not shift the pages. Only the items of the page,
+    and one more telling whether there is a next page, are asked to the
+    node. Without limit, the whole generator is returned.
+
+    Arguments:
+    - `resource`: class of a ucoin merkle resource, ucoin.pks.All for instance
+    - `path`: path of the merkle list in the resource, /all for instance
+    - `args`: arguments of the resource
+    """
+
+    limit = request.args.get('limit', type=int)
+    if not limit or limit < 0:
+        return resource(*args).get(), None
+
+    begin = 0
+    if request.args.get('cursor'):
+        leaf = decode_cursor(request.args['cursor'])
+        leaves = resource(*args).requests_get(path, leaves='true').json()['leaves']
+        if leaf not in leaves: abort(400)
+        begin = leaves.index(leaf) + 1
+
+    items = list(itertools.islice(resource(*args, begin=begin, end=begin+limit+1).get(), limit+1))
+    return items[:limit], encode_cursor(items[limit-1]['hash']) if len(items) > limit else None
+
+def render_prettyprint(template_name, result, cursor=None):
+    args = request.args.to_dict()
+    args.update(request.view_args or {})
+    args['cursor'] = cursor
+    next_url = url_for(request.endpoint, **args) if cursor else None
+
+    format = get_format()
+    if format is not None:
+        response = Response(stream(format, result), mimetype=FORMATS[format])
+        if next_url: response.headers['Link'] = '<%s>; rel="next"' % next_url
+        return response
+
+    if is_stream(result): result = list(result)
     s = StringIO()
     pprint(result, s)
     s = s.getvalue().replace('\\r', '').replace('\\n', '\n')
-    return render_template(template_name, result=s, style='prettyprint')
+    return render_template(template_name, result=s, style='prettyprint', next_url=next_url)
 
 @bp.route('/')
 def home():
@@ -64,7 +152,10 @@ def pks_lookup():
 
 @bp.route('/pks/all')
 def pks_all():
-    return render_prettyprint('api/result.html', list(ucoin.pks.All().get()))
+    # streams and pages are sent as the items arrive, without waiting for the other calls
+    if not get_format() and not request.args.get('limit'):
+        return render_prettyprint('api/result.html', flights.get(ucoin.pks.All()))
+    return render_prettyprint('api/result.html', *paginate(ucoin.pks.All, '/all'))
 
 @bp.route('/ucg/pubkey')
 def ucg_pubkey():
@@ -76,7 +167,7 @@ def ucg_peering():
 
 @bp.route('/ucg/peering/keys')
 def ucg_peering_keys():
-    return render_prettyprint('api/result.html', list(ucoin.ucg.peering.Keys().get()))
+    return render_prettyprint('api/result.html', ucoin.ucg.peering.Keys().get())
 
 @bp.route('/ucg/peering/peer')
 def ucg_peering_peer():
@@ -85,7 +176,7 @@ def ucg_peering_peer():
 @bp.route('/ucg/peering/peers', methods=['GET', 'POST'])
 def ucg_peering_peers():
     if request.method == 'GET':
-        return render_prettyprint('api/result.html', list(ucoin.ucg.peering.Peers().get()))
+        return render_prettyprint('api/result.html', ucoin.ucg.peering.Peers().get())
 
     entry = request.form.get('entry')
     signature = request.form.get('signature')
@@ -131,7 +222,7 @@ def ucg_peering_status():
 @bp.route('/ucg/tht', methods=['GET', 'POST',])
 def ucg_tht():
     if request.method == 'GET':
-        return render_prettyprint('api/result.html', list(ucoin.ucg.THT().get()))
+        return render_prettyprint('api/result.html', ucoin.ucg.THT().get())
 
     entry = request.form.get('entry')
     signature = request.form.get('signature')
@@ -144,11 +235,11 @@ def ucg_tht_pgp(pgp_fingerprint):
 
 @bp.route('/hdc/amendments/current')
 def hdc_amendments_current():
-    return render_prettyprint('api/result.html', ucoin.hdc.amendments.Current().get())
+    return render_prettyprint('api/result.html', flights.get(ucoin.hdc.amendments.Current()))
 
 @bp.route('/hdc/amendments/current/votes')
 def hdc_amendments_current_votes():
-    return render_prettyprint('api/result.html', list(ucoin.hdc.amendments.CurrentVotes().get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.amendments.CurrentVotes().get())
 
 @bp.route('/hdc/amendments/promoted')
 def hdc_amendments_promoted():
@@ -160,7 +251,7 @@ def hdc_amendments_promoted_am(amendment_number):
 
 @bp.route('/hdc/amendments/view/<amendment_id>/members')
 def hdc_amendments_view_am_members(amendment_id):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.amendments.views.Members(amendment_id).get()))
+    return render_prettyprint('api/result.html', *paginate(ucoin.hdc.amendments.views.Members, '/members', amendment_id))
 
 @bp.route('/hdc/amendments/view/<amendment_id>/self')
 def hdc_amendments_view_am_self(amendment_id):
@@ -168,11 +259,11 @@ def hdc_amendments_view_am_self(amendment_id):
 
 @bp.route('/hdc/amendments/view/<amendment_id>/voters')
 def hdc_amendments_view_am_voters(amendment_id):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.amendments.views.Voters(amendment_id).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.amendments.views.Voters(amendment_id).get())
 
 @bp.route('/hdc/amendments/view/<amendment_id>/signatures')
 def hdc_amendments_view_am_signatures(amendment_id):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.amendments.views.Signatures(amendment_id).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.amendments.views.Signatures(amendment_id).get())
 
 @bp.route('/hdc/amendments/votes', methods=['GET', 'POST'])
 def hdc_amendments_votes():
@@ -187,7 +278,7 @@ def hdc_amendments_votes():
 
 @bp.route('/hdc/amendments/votes/<amendment_id>')
 def hdc_amendments_votes_am(amendment_id):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.amendments.Votes(amendment_id).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.amendments.Votes(amendment_id).get())
 
 @bp.route('/hdc/coins/<pgp_fingerprint>/list')
 def hdc_coins_pgp_list(pgp_fingerprint):
@@ -210,11 +301,11 @@ def hdc_transactions_process():
 
 @bp.route('/hdc/transactions/all')
 def hdc_transactions_all():
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.All().get()))
+    return render_prettyprint('api/result.html', *paginate(ucoin.hdc.transactions.All, '/all'))
 
 @bp.route('/hdc/transactions/keys')
 def hdc_transactions_keys():
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.Keys().get()))
+    return render_prettyprint('api/result.html', *paginate(ucoin.hdc.transactions.Keys, '/keys'))
 
 @bp.route('/hdc/transactions/last')
 def hdc_transactions_last():
@@ -226,7 +317,7 @@ def hdc_transactions_last_count(count):
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>')
 def hdc_transactions_sender_pgp(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.Sender(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.Sender(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/last')
 def hdc_transactions_sender_pgp_last(pgp_fingerprint):
@@ -238,11 +329,11 @@ def hdc_transactions_sender_pgp_last_count(pgp_fingerprint, count):
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/transfer')
 def hdc_transactions_sender_pgp_transfer(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.sender.Transfer(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.sender.Transfer(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/issuance')
 def hdc_transactions_sender_pgp_issuance(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.sender.Issuance(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.sender.Issuance(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/issuance/last')
 def hdc_transactions_sender_pgp_issuance_last(pgp_fingerprint):
@@ -250,19 +341,19 @@ def hdc_transactions_sender_pgp_issuance_last(pgp_fingerprint):
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/issuance/fusion')
 def hdc_transactions_sender_pgp_issuance_fusion(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.sender.issuance.Fusion(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.sender.issuance.Fusion(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/issuance/dividend')
 def hdc_transactions_sender_pgp_issuance_dividend(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/sender/<pgp_fingerprint>/issuance/dividend/<int:amendment_number>')
 def hdc_transactions_sender_pgp_issuance_dividend_am(pgp_fingerprint, amendment_number):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint, amendment_number).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint, amendment_number).get())
 
 @bp.route('/hdc/transactions/recipient/<pgp_fingerprint>')
 def hdc_transactions_recipient_pgp(pgp_fingerprint):
-    return render_prettyprint('api/result.html', list(ucoin.hdc.transactions.Recipient(pgp_fingerprint).get()))
+    return render_prettyprint('api/result.html', ucoin.hdc.transactions.Recipient(pgp_fingerprint).get())
 
 @bp.route('/hdc/transactions/view/<transaction_id>')
 def hdc_transactions_view_tx(transaction_id):
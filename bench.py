@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import\
+    logging, argparse, sys, hashlib,\
+    random, time, tracemalloc, os, binascii,\
+    json, threading, tempfile, shutil, urllib.parse
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from core.merkle import Merkle, IncrementalMerkle, BACKENDS
+from core.fanout import fanout
+from core.coins import select, POLICIES
+
+logger = logging.getLogger("bench")
+
+def fingerprints(count, seed=0):
+    """returns a sorted list of random fingerprints
+
+    Arguments:
+    - `count`: number of fingerprints
+    - `seed`: random seed
+    """
+
+    r = random.Random(seed)
+    return sorted(hashlib.sha1(str(r.random()).encode('ascii')).hexdigest().upper() for _ in range(count))
+
+def timeit(fct, repeat=3):
+    """returns the best elapsed time of several runs of fct"""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fct()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best: best = elapsed
+    return best
+
+class StubNode(ThreadingHTTPServer):
+    """local HTTP server answering every GET with a JSON document after a delay, counting opened connections
+
+    The document is the same for every path, or returned by a function of
+    the path and of the query arguments, None for a 404 response.
+    """
+
+    daemon_threads = True
+    # concurrent clients opening connections at once must not overflow the listen queue
+    request_queue_size = 128
+
+    def __init__(self, delay=0, document=None):
+        self.delay = delay
+        self.document = document if callable(document) else lambda path, query: document or {}
+        self.connections = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(handler):
+                self.connections += 1
+                super(Handler, handler).setup()
+
+            def do_GET(handler):
+                if self.delay: time.sleep(self.delay)
+                url = urllib.parse.urlsplit(handler.path)
+                document = self.document(url.path, dict(urllib.parse.parse_qsl(url.query)))
+                body = json.dumps(document).encode('ascii')
+                handler.send_response(200 if document is not None else 404)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(('localhost', 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path='/'):
+        return 'http://localhost:%d%s' % (self.server_address[1], path)
+
+def merkle_incremental(args):
+    logger.debug('merkle_incremental')
+
+    print('Leaves\t\tChanges\tRebuild (s)\tAppend (s)\tSorted insert (s)')
+    for size in args.sizes:
+        leaves = fingerprints(size)
+        changes = fingerprints(args.changes, seed=size)
+
+        def rebuild():
+            Merkle(leaves + changes).process()
+
+        tree = IncrementalMerkle(list(leaves)).process()
+        def append():
+            tree.extend(changes)
+            for _ in changes: tree.remove(len(tree)-1)
+
+        def insert():
+            for fpr in changes: tree.insert(tree.bisect(fpr), fpr)
+            for fpr in changes: tree.remove(tree.bisect(fpr))
+
+        print('%d\t\t%d\t%.4f\t\t%.4f\t\t%.4f' % (size, args.changes, timeit(rebuild, args.repeat),
+                                                   timeit(append, args.repeat), timeit(insert, args.repeat)))
+
+def merkle_parallel(args):
+    logger.debug('merkle_parallel')
+
+    leaves = fingerprints(args.size)
+    serial = timeit(lambda: Merkle(leaves).process(), args.repeat)
+
+    print('Leaves: %d, serial: %.4fs\n' % (args.size, serial))
+    print('Pool\t\tWorkers\tTime (s)\tSpeedup')
+    for name, pool in [('thread', ThreadPoolExecutor), ('process', ProcessPoolExecutor)]:
+        for workers in args.workers:
+            with pool(workers) as executor:
+                elapsed = timeit(lambda: Merkle(leaves, executor=executor, threshold=args.threshold).process(), args.repeat)
+            print('%s\t\t%d\t%.4f\t\t%.2fx' % (name, workers, elapsed, serial/elapsed))
+
+def merkle_backends(args):
+    logger.debug('merkle_backends')
+
+    print('Leaves\t\tBackend\t\tTime (s)\tLeaves/s\tPeak memory (MiB)')
+    for size in args.sizes:
+        leaves = [binascii.hexlify(os.urandom(20)).decode('ascii') for _ in range(size)]
+        for name, backend in BACKENDS.items():
+            trees = [Merkle(leaves, backend=backend()) for _ in range(args.repeat)]
+            elapsed = timeit(lambda: trees.pop().process(), args.repeat)
+
+            tree = Merkle(leaves, backend=backend())
+            tracemalloc.start()
+            tree.process()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            print('%d\t\t%s\t\t%.4f\t\t%d\t\t%.2f' % (size, name, elapsed, size/elapsed, peak/2**20))
+
+def http_pool(args):
+    logger.debug('http_pool')
+
+    import requests
+    from core.session import Session
+
+    print('Client\t\tRequests\tConnections\tTime (s)')
+    for name, client in [('requests', requests), ('session', Session())]:
+        node = StubNode()
+        start = time.perf_counter()
+        for _ in range(args.count): client.get(node.url('/hdc/amendments/current')).json()
+        elapsed = time.perf_counter() - start
+        node.shutdown()
+        print('%s\t%d\t\t%d\t\t%.4f' % (name, args.count, node.connections, elapsed))
+
+def dividends_node(pgp_fingerprint, amendments):
+    """returns a function answering the requests of a remainder refresh, with the amendments, the issuance merkle list and the dividend issuances of a member
+
+    Every amendment has a dividend of 100, a third of them being partly issued.
+
+    Arguments:
+    - `pgp_fingerprint`: member fingerprint
+    - `amendments`: number of amendments
+    """
+
+    chain = []
+    for n in range(amendments):
+        raw = 'Version: 1\nNumber: %d\nDividend: 100\n' % n
+        chain.append({'number': n, 'dividend': 100, 'raw': raw,
+                      'previousHash': hashlib.sha1(chain[-1]['raw'].encode('ascii')).hexdigest().upper() if chain else None})
+
+    issuances = {}
+    for n in range(0, amendments, 3):
+        coin = '%s-%d-%d-%d-A-%d' % (pgp_fingerprint, n, n % 9 + 1, n % 2, n)
+        leaf = {'hash': hashlib.sha1(coin.encode('ascii')).hexdigest().upper(),
+                'value': {'transaction': {'type': 'ISSUANCE', 'coins': [{'id': coin}]}}}
+        issuances.setdefault(n, []).append(leaf)
+
+    def merkle(leaves, query):
+        if query.get('leaves') == 'true': return {'leaves': sorted(leaf['hash'] for leaf in leaves)}
+        return {'leaf': next(leaf for leaf in leaves if leaf['hash'] == query['leaf'])}
+
+    prefix = '/hdc/transactions/sender/%s/issuance' % pgp_fingerprint
+    def document(path, query):
+        if path == '/hdc/amendments/current': return chain[-1]
+        if path.startswith('/hdc/amendments/promoted/'): return chain[int(path.split('/')[-1])]
+        if path.startswith('/hdc/amendments/view/'): return chain[int(path.split('/')[-2].split('-')[0])]
+        if path == prefix: return merkle([leaf for leaves in issuances.values() for leaf in leaves], query)
+        if path.startswith(prefix + '/dividend/'): return merkle(issuances.get(int(path.split('/')[-1]), []), query)
+        return None
+
+    return document
+
+def dividends_fanout(args):
+    logger.debug('dividends_fanout')
+
+    import ucoin, core.session
+    from core.ledger import RemainderLedger
+
+    pgp_fingerprint = fingerprints(1)[0]
+    node = StubNode(delay=args.latency, document=dividends_node(pgp_fingerprint, args.amendments))
+    ucoin.settings.update({'server': 'localhost', 'port': node.server_address[1], 'auth': False,
+                           'pool_maxsize': max(args.limits)})
+    core.session.install(ucoin)
+
+    print('Amendments: %d, latency: %.3fs\n' % (args.amendments, args.latency))
+    print('Limit\tTime (s)\tSpeedup')
+    serial = None
+    for limit in args.limits:
+        # a remainder refresh from an empty data directory, syncing the amendments and fetching every dividend issuance
+        directory = tempfile.mkdtemp()
+        start = time.perf_counter()
+        remainders = RemainderLedger(directory, pgp_fingerprint, limit).refresh().remainders
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(directory)
+
+        if serial is None:
+            serial, expected = elapsed, remainders
+        assert remainders == expected, 'remainders with a limit of %d differ from the ones with a limit of %d' % (limit, args.limits[0])
+        print('%d\t%.4f\t\t%.1fx' % (limit, elapsed, serial/elapsed))
+    node.shutdown()
+
+def greedy(amounts, amount):
+    """returns the coins picked from the largest one while they fit, the former selector of transfers"""
+
+    coins = []
+    total = 0
+    for coin in sorted(amounts, reverse=True):
+        if total >= amount: break
+        if total+coin <= amount:
+            coins.append(coin)
+            total += coin
+    return coins if total == amount else None
+
+def coins_selection(args):
+    logger.debug('coins_selection')
+
+    r = random.Random(0)
+    bases = [1,2,5] if args.bases == '125' else list(range(1, 10))
+    denominations = [base*10**power for power in range(args.powers) for base in bases]
+    # with 1/2/5 bases, few coins of base 1, as in wallets where they were spent first, the case greedy misses
+    weights = [1 if args.bases == '125' and str(coin).startswith('1') else 4 for coin in denominations]
+
+    print('Bases %s' % args.bases)
+    print('Coins		Selector	Found		Coins spent	Time (s)')
+    for size in args.sizes:
+        amounts = r.choices(denominations, weights, k=size)
+        targets = [r.randint(1, sum(amounts)//2) for _ in range(args.transfers)]
+
+        for name, selector in [('greedy', greedy)] + [(policy, lambda a, x, policy=policy: select(a, x, policy)) for policy in POLICIES]:
+            results = []
+            elapsed = timeit(lambda: results.__setitem__(slice(None), [selector(amounts, x) for x in targets]), args.repeat)
+            found = [x for x in results if x is not None]
+            print('%d\t\t%s\t\t%d/%d\t\t%.1f\t\t%.4f' % (size, name, len(found), len(targets),
+                                                        sum(len(x) for x in found)/max(len(found), 1), elapsed))
+
+if __name__ == '__main__':
+    common_options = {'formatter_class': argparse.ArgumentDefaultsHelpFormatter}
+
+    parser = argparse.ArgumentParser(description='uPyCoin benchmarks.', **common_options)
+
+    levels = OrderedDict([('debug', logging.DEBUG),
+                          ('info', logging.INFO),
+                          ('warning', logging.WARNING),
+                          ('error', logging.ERROR),
+                          ('quiet', logging.CRITICAL),])
+
+    parser.add_argument('--verbose', '-v', choices=[x for x in levels.keys()], default='error', help='set a verbosity level')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='number of runs, the best one is kept')
+
+    subparsers = parser.add_subparsers(help='sub-command help')
+
+    sp = subparsers.add_parser('merkle-incremental', help='Compare a full Merkle rebuild with incremental updates', **common_options)
+    sp.add_argument('--sizes', '-s', type=int, nargs='+', default=[1000, 10000, 100000], help='leaves counts')
+    sp.add_argument('--changes', '-c', type=int, default=10, help='number of leaves changed per amendment')
+    sp.set_defaults(func=merkle_incremental)
+
+    sp = subparsers.add_parser('merkle-parallel', help='Compare serial and parallel Merkle level hashing by core count', **common_options)
+    sp.add_argument('--size', '-s', type=int, default=500000, help='leaves count')
+    sp.add_argument('--workers', '-w', type=int, nargs='+', default=[1, 2, 4, 8], help='pool sizes')
+    sp.add_argument('--threshold', '-t', type=int, default=2**16, help='minimal level size hashed in parallel')
+    sp.set_defaults(func=merkle_parallel)
+
+    sp = subparsers.add_parser('merkle-backends', help='Compare the throughput and peak memory of the Merkle hash backends', **common_options)
+    sp.add_argument('--sizes', '-s', type=int, nargs='+', default=[1000, 100000, 1000000], help='leaves counts')
+    sp.set_defaults(func=merkle_backends)
+
+    sp = subparsers.add_parser('http-pool', help='Compare fresh connections with the shared keep-alive session against a local stub node', **common_options)
+    sp.add_argument('--count', '-n', type=int, default=500, help='number of requests')
+    sp.set_defaults(func=http_pool)
+
+    sp = subparsers.add_parser('dividends-fanout', help='Time remainder refreshes by concurrency limit against a local stub node adding latency, checking they match the first one', **common_options)
+    sp.add_argument('--amendments', '-n', type=int, default=100, help='number of amendments with a dividend')
+    sp.add_argument('--latency', '-l', type=float, default=0.05, help='latency of the stub node in seconds')
+    sp.add_argument('--limits', '-c', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='concurrency limits, the first one being the reference')
+    sp.set_defaults(func=dividends_fanout)
+
+    sp = subparsers.add_parser('coins-selection', help='Compare the greedy coin selector with the exact selection policies', **common_options)
+    sp.add_argument('--sizes', '-s', type=int, nargs='+', default=[10, 100, 1000, 10000], help='coins counts of the wallets')
+    sp.add_argument('--transfers', '-n', type=int, default=100, help='number of random amounts to reach')
+    sp.add_argument('--powers', '-p', type=int, default=4, help='number of powers of ten of the denominations')
+    sp.add_argument('--bases', '-b', choices=['125', '1-9'], default='125', help='bases of the denominations, 1/2/5 or 1 to 9 times a power of ten')
+    sp.set_defaults(func=coins_selection)
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=levels.get(args.verbose, logging.NOTSET),
+        format='%(name)-12s: %(levelname)-8s %(message)s'
+    )
+
+    if 'func' not in args:
+        parser.print_help()
+        sys.exit()
+
+    args.func(args)
@@ -21,9 +21,12 @@ from pprint import pprint
 import\
     ucoin, json, logging, argparse, sys,\
     gnupg, hashlib, re, datetime as dt,\
-    core
+    core, core.session, core.coins
 from collections import OrderedDict
-from core.merkle import Merkle
+from core.merkle import IncrementalMerkle
+from core.store import MerkleStore
+from core.amendments import AmendmentChain
+from core.keyring import Keyring
 
 logger = logging.getLogger("cli")
 
@@ -53,10 +56,22 @@ VotersCount\t\t%(votersCount)s\
         print('VotersChanges')
         for x in am['votersChanges']: print(x)
 
+def get_chain():
+    """returns the local amendment chain, synced with the node"""
+
+    return AmendmentChain(ucoin.settings.get('data', 'data'), ucoin.settings.get('concurrency', 8)).sync()
+
 def current():
     logger.debug('current')
 
-    print_amendment(ucoin.hdc.amendments.Current().get())
+    # the current amendment only, without syncing the whole chain
+    try:
+        current = ucoin.hdc.amendments.Current().get()
+    except ValueError:
+        print('No amendment promoted yet')
+        return
+
+    print_amendment(current)
 
 def contract():
     logger.debug('contract')
@@ -67,7 +82,7 @@ def contract():
 -----------------------------------\
     """)
 
-    for am in ucoin.hdc.amendments.List().get():
+    for am in get_chain().amendments:
         print_amendment(am)
         print('------------------------------------')
 
@@ -175,6 +190,44 @@ def divide():
     else:
         print('Posted divide transaction')
 
+def compact():
+    logger.debug('compact')
+
+    __sum, coins = ucoin.wrappers.coins.List(ucoin.settings['fingerprint'])()
+    amounts = [c['amount'] for c in coins]
+
+    plan = core.coins.plan(amounts, ucoin.settings['keep'])
+    if plan is None:
+        print('Wallet is already compact (%d coins)' % len(amounts))
+        return
+
+    kind, spent, created = plan
+    print('%s of %d coins (%s) into %d coins (%s), %d coins left' % (kind.title(), len(spent), ' + '.join(str(x) for x in spent),
+                                                                    len(created), ' + '.join(str(x) for x in created),
+                                                                    len(amounts) - len(spent) + len(created)))
+    if ucoin.settings['dry_run']: return
+
+    old_coins = ucoin.wrappers.coins.Get(ucoin.settings['fingerprint'], spent)()
+
+    if kind == 'fusion':
+        transaction = ucoin.wrappers.transactions.Fusion(ucoin.settings['fingerprint'],
+                                                         old_coins,
+                                                         ucoin.settings['message'])
+    else:
+        new_coins = []
+        for coin in created:
+            power = len(str(coin)) - 1
+            new_coins.append('%d,%d' % (coin // 10**power, power))
+        transaction = ucoin.wrappers.transactions.Divide(ucoin.settings['fingerprint'],
+                                                         old_coins,
+                                                         new_coins,
+                                                         ucoin.settings['message'])
+
+    if not transaction():
+        print(transaction.get_error())
+    else:
+        print('Posted %s transaction' % kind)
+
 def host_add():
     logger.debug('host_add')
 
@@ -199,6 +252,37 @@ def tht():
 def pub_tht():
     logger.debug('pub_tht')
 
+def forge_merkle(kind, current, __dict, to_add, to_remove):
+    """returns the members or voters merkle tree of the forged amendment and its sorted changes
+
+    With a store directory, the tree of the current amendment is loaded from
+    disk instead of being rebuilt from the view of the node.
+    """
+
+    store = MerkleStore(ucoin.settings['store'], kind) if ucoin.settings.get('store') else None
+    tree = None
+
+    if current and store:
+        tree = store.load(current['number'])
+        if tree is not None and tree.root() != current['%sRoot' % kind]:
+            logger.warning('stored %s of amendment #%d do not match, fetching them' % (kind, current['number']))
+            tree = None
+
+    if current and tree is None:
+        view = getattr(ucoin.hdc.amendments.view, kind.title())('%(previousNumber)d-%(previousHash)s' % __dict).get()
+        tree = IncrementalMerkle(sorted(set(x['hash'] for x in view))).process()
+        if store: store.save(current['number'], tree)
+
+    if tree is None:
+        tree = IncrementalMerkle([]).process()
+
+    added, removed = tree.apply(to_add, to_remove)
+    if store: store.save(__dict['number'], tree)
+
+    changes = ['+' + fpr for fpr in added] + ['-' + fpr for fpr in removed]
+    changes.sort()
+    return tree, changes
+
 def forge_am():
     logger.debug('forge_am')
 
@@ -225,10 +309,7 @@ def forge_am():
     if not ucoin.settings['changes'] and ucoin.settings['stdin']:
         ucoin.settings['changes'] = input()
 
-    try:
-        current = ucoin.hdc.amendments.Current().get()
-    except ValueError:
-        current = None
+    current = get_chain().current()
 
     __dict = {}
     __dict.update(ucoin.settings)
@@ -262,79 +343,13 @@ NextRequiredVotes: %(votes)d
     members_to_remove = list(map(remove_sign, filter(filter_minus, members_changes)))
     voters_to_add = list(map(remove_sign, filter(filter_plus, voters_changes)))
     voters_to_remove = list(map(remove_sign, filter(filter_minus, voters_changes)))
-    members_to_add = list(set(members_to_add) - set(members_to_remove))
-
-    if __dict['number']:
-        members_view = ucoin.hdc.amendments.view.Members('%(previousNumber)d-%(previousHash)s' % __dict).get()
-    else:
-        members_view = None
-
-    members = []
-    previous_members = []
-    really_added_members = []
-    really_removed_members = []
-
-    for fingerprint in members_view:
-        members.append(fingerprint['hash'])
-        previous_members.append(fingerprint['hash'])
 
-    for fingerprint in members_to_add:
-        members.append(fingerprint)
-
-    members = list(set(members))
-    members = list(set(members) - set(members_to_remove))
-
-    members.sort()
-
-    really_added_members = list(set(members) - set(previous_members))
-    really_removed_members = list(set(members_to_remove) - set(members))
-    really_removed_members = list(set(really_removed_members) & set(previous_members))
-
-    members_merkle = Merkle(members).process()
-
-    members_changes = []
-    for fpr in really_added_members:
-        members_changes.append('+' + fpr)
-    for fpr in really_removed_members:
-        members_changes.append('-' + fpr)
-    members_changes.sort()
-    __dict['members_count'] = len(members_merkle.leaves)
+    members_merkle, members_changes = forge_merkle('members', current, __dict, members_to_add, members_to_remove)
+    __dict['members_count'] = len(members_merkle)
     __dict['members_root'] = members_merkle.root()
 
-    if __dict['number']:
-        voters_view = ucoin.hdc.amendments.view.Voters('%(previousNumber)d-%(previousHash)s' % __dict).get()
-    else:
-        voters_view = None
-
-    voters = []
-    previous_voters = []
-    really_added_voters = []
-    really_removed_voters = []
-
-    for fingerprint in voters_view:
-        voters.append(fingerprint['hash'])
-        previous_voters.append(fingerprint['hash'])
-
-    for fingerprint in voters_to_add:
-        voters.append(fingerprint)
-
-    voters = list(set(voters))
-    voters = list(set(voters) - set(voters_to_remove))
-
-    voters.sort()
-
-    really_added_voters = list(set(voters) - set(previous_voters))
-    really_removed_voters = list(set(voters_to_remove) - set(voters))
-
-    voters_merkle = Merkle(voters).process()
-
-    voters_changes = []
-    for fpr in really_added_voters:
-        voters_changes.append('+' + fpr)
-    for fpr in really_removed_voters:
-        voters_changes.append('-' + fpr)
-    voters_changes.sort()
-    __dict['voters_count'] = len(voters_merkle.leaves)
+    voters_merkle, voters_changes = forge_merkle('voters', current, __dict, voters_to_add, voters_to_remove)
+    __dict['voters_count'] = len(voters_merkle)
     __dict['voters_root'] = voters_merkle.root()
 
     am += """\
@@ -481,6 +496,12 @@ if __name__ == '__main__':
     sp.add_argument('--message', '-m', help='write a comment', default='')
     sp.set_defaults(func=divide)
 
+    sp = subparsers.add_parser('compact', help='Fusion or divide coins so that the wallet holds a few coins of each 1, 2 and 5 times a power of ten value', **common_options)
+    sp.add_argument('--keep', '-k', type=int, default=2, help='number of coins of each value kept as change')
+    sp.add_argument('--dry-run', '-n', action='store_true', default=False, help='print the planned transaction without posting it')
+    sp.add_argument('--message', '-m', help='write a comment', default='')
+    sp.set_defaults(func=compact)
+
     sp = subparsers.add_parser('host-add', help='Add given key fingerprint to hosts managing transactions of key -u', **common_options)
     sp.add_argument('key', help='key fingerprint')
     sp.set_defaults(func=host_add)
@@ -510,6 +531,7 @@ if __name__ == '__main__':
     sp.add_argument('--votes', '-n', type=int, help='Number of required votes', required=True)
     sp.add_argument('--timestamp', '-t', type=int, help='Generation timestamp')
     sp.add_argument('--stdin', '-C', action='store_true', default=False, help='forge-am will read community changes from STDIN')
+    sp.add_argument('--store', '-S', help='directory keeping the members and voters merkle trees of each amendment')
     sp.set_defaults(func=forge_am)
 
     sp = subparsers.add_parser('clist', help='List coins of given user. May be limited by upper amount.', **common_options)
@@ -560,14 +582,16 @@ if __name__ == '__main__':
         logger.debug('selected keyid: %s' % ucoin.settings['user'])
         ucoin.settings['gpg'] = gpg = gnupg.GPG(options=['-u %s' % ucoin.settings['user']])
 
-        keys = gpg.list_keys(True)
-        for idx, fp in enumerate(keys.fingerprints):
+        keyring = Keyring(gpg, ucoin.settings.get('data', 'data'))
+        for fp, key in keyring.keys('secret').items():
             if fp[-8:] == ucoin.settings['user']:
-                ucoin.settings.update(keys[idx])
+                ucoin.settings.update(key)
                 break
     else:
         ucoin.settings['gpg'] = gpg = gnupg.GPG()
 
+    core.session.install(ucoin)
+
     ucoin.settings.update(ucoin.ucg.Peering().get())
 
     logger.debug(args)
@@ -0,0 +1,175 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import ucoin, hashlib, json, logging, os
+from core.fanout import fanout
+from core.filelock import FileLock
+
+logger = logging.getLogger("amendments")
+
+def get_hash(am):
+    """returns the hash of an amendment, as written in the PreviousHash field of the next one"""
+
+    return hashlib.sha1(am['raw'].encode('ascii')).hexdigest().upper()
+
+class AmendmentChain:
+    """
+    class to keep on disk a verified copy of the promoted amendments.
+
+    Amendments are stored one JSON document per line, by number. A sync only
+    fetches the amendments promoted since the last known one, each one having
+    to refer to the hash of the previous one. An empty or truncated chain is
+    filled from the list of the amendments, walked back from the current one
+    by the node down to the last known one. When the
+    node does not agree with the local copy anymore, the fork point is
+    searched by bisection and the chain is synced again from there.
+    """
+
+    def __init__(self, directory, concurrency=8):
+        """ctor enables to set the directory of the chain file
+
+        Arguments:
+        - `directory`: directory of the chain file, created if needed
+        - `concurrency`: maximal number of concurrent requests
+        """
+
+        self.path = os.path.join(directory, 'amendments.jsonl')
+        self.concurrency = concurrency
+        # syncs run in several threads and in the processes sharing the directory
+        self.lock = FileLock(self.path)
+        self.amendments = []
+        self.resynced = None
+
+        os.makedirs(directory, exist_ok=True)
+        with self.lock: self.load()
+
+    def __len__(self):
+        return len(self.amendments)
+
+    def load(self):
+        """reads the chain file, if any, up to the first amendment out of place, the lock being held
+
+        The number of the first amendment out of place is kept in resynced,
+        so that the next sync writes the chain file again.
+        """
+
+        self.amendments = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if not line.strip(): continue
+                    am = json.loads(line)
+                    if am['number'] != len(self.amendments):
+                        logger.warning('amendment #%d found at line %d, syncing again from there' % (am['number'], len(self.amendments)+1))
+                        self.resynced = len(self.amendments)
+                        break
+                    self.amendments.append(am)
+        except FileNotFoundError:
+            pass
+        return self
+
+    def current(self):
+        """returns the last amendment, None if the chain is empty"""
+
+        return self.amendments[-1] if self.amendments else None
+
+    def dividends(self, begin=0):
+        """returns the dividend of each amendment having one, from a number
+
+        Arguments:
+        - `begin`: first amendment number
+        """
+
+        return {am['number']: am['dividend'] for am in self.amendments[begin:] if am['dividend']}
+
+    def sync(self):
+        """fetches the amendments promoted since the last known one, going back to the fork point if needed
+
+        The number of the first amendment fetched again because of a fork or
+        of a rollback of the node is kept in resynced, None otherwise.
+        """
+
+        with self.lock:
+            self.resynced = None
+            self.load()
+
+            try:
+                current = ucoin.hdc.amendments.Current().get()
+            except ValueError:
+                return self
+
+            fetch = lambda n: current if n == current['number'] else ucoin.hdc.amendments.Promoted(n).get()
+
+            # the amendment of the node having the last known number must be the local one
+            known = min(current['number'], len(self.amendments)-1)
+            if known >= 0 and get_hash(fetch(known)) != get_hash(self.amendments[known]):
+                known = self.__get_fork__(known, fetch)
+                logger.warning('fork after amendment #%d' % known)
+            if known < len(self.amendments)-1:
+                self.resynced = known+1
+                self.amendments = self.amendments[:known+1]
+
+            numbers = range(len(self.amendments), current['number']+1)
+            logger.debug('%d known amendments, %d to fetch' % (len(self.amendments), len(numbers)))
+
+            if len(numbers) > 1 and (not self.amendments or self.resynced is not None):
+                new = []
+                for am in ucoin.hdc.amendments.List().get():
+                    if am['number'] < numbers.start: break
+                    if am['number'] in numbers: new.append(am)
+                new.sort(key=lambda am: am['number'])
+            else:
+                new = fanout(fetch, numbers, self.concurrency)
+
+            previous = self.current()
+            for number, am in zip(numbers, new):
+                # the list of the amendments may lack some of them
+                if am['number'] != number:
+                    raise ValueError('amendment #%d found instead of amendment #%d' % (am['number'], number))
+                if previous is not None and am['previousHash'] != get_hash(previous):
+                    raise ValueError('amendment #%d does not follow amendment #%d' % (am['number'], previous['number']))
+                previous = am
+
+            self.amendments.extend(new)
+            if self.resynced is not None:
+                self.__write__(self.amendments, 'w')
+            else:
+                self.__write__(new, 'a')
+            return self
+
+    def __get_fork__(self, known, fetch):
+        """Returns the last amendment number shared with the node, -1 for none. This method is private."""
+
+        # amendments are chained, so the shared ones are a prefix
+        shared, forked = -1, known
+        while forked - shared > 1:
+            middle = (shared + forked) // 2
+            if get_hash(fetch(middle)) == get_hash(self.amendments[middle]):
+                shared = middle
+            else:
+                forked = middle
+        return shared
+
+    def __write__(self, amendments, mode):
+        """Appends amendments to the chain file, or replaces it atomically. This method is private."""
+
+        path = self.path + '.tmp' if mode == 'w' else self.path
+        with open(path, mode) as f:
+            for am in amendments: f.write(json.dumps(am) + '\n')
+        if mode == 'w':
+            os.replace(path, self.path)
@@ -0,0 +1,426 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import hashlib, logging, os, pickle, struct, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger("cache")
+
+class FileBackend:
+    """
+    class to share cache entries between processes through a directory, one file per entry.
+
+    Each file begins with the expiration time of its entry, so that sweep()
+    reads a few bytes per file. An expired entry is removed when it is read,
+    and the directory is swept every interval seconds by set(), removing the
+    expired entries, then the least recently written ones until it holds at
+    most max_bytes.
+
+    >>> import tempfile
+    >>> backend = FileBackend(tempfile.mkdtemp())
+    >>> now = time.time()
+    >>> backend.set('ns', 'key', (now, now+60, now+60, b'data'))
+    >>> backend.get('ns', 'key')[3]
+    b'data'
+    >>> backend.set('ns', 'old', (now-60, now-60, now-1, b'data'))
+    >>> backend.get('ns', 'old') is None, len(os.listdir(backend.directory))
+    (True, 1)
+    """
+
+    HEADER = struct.Struct('<d')
+
+    def __init__(self, directory, max_bytes=256*2**20, interval=60):
+        """ctor enables to set the directory of the entries and its budget
+
+        Arguments:
+        - `directory`: directory of the entries, created if needed
+        - `max_bytes`: maximal size of the files of the directory
+        - `interval`: minimal delay in seconds between two sweeps
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.swept = time.time()
+        self.sweeping = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, namespace, key):
+        """returns the path of the file of an entry"""
+
+        name = hashlib.sha1(('%s:%s' % (namespace, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def stamp(self, namespace, key):
+        """returns the modification time of an entry, None if it is missing"""
+
+        try:
+            return os.stat(self.path(namespace, key)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self, namespace, key):
+        """returns an entry with the modification time of its file, None if it is missing or expired, removing it then"""
+
+        path = self.path(namespace, key)
+        try:
+            with open(path, 'rb') as f:
+                expires, = self.HEADER.unpack(f.read(self.HEADER.size))
+                if expires < time.time():
+                    self.__remove__(path)
+                    return None
+                entry = pickle.load(f)
+                stamp = os.fstat(f.fileno()).st_mtime_ns
+        except (FileNotFoundError, EOFError, struct.error, pickle.UnpicklingError):
+            return None
+        return entry + (stamp,)
+
+    def set(self, namespace, key, entry):
+        """writes an entry atomically, sweeping the directory when it was not swept for interval seconds
+
+        Arguments:
+        - `entry`: creation time, end of freshness, expiration time and pickled value
+        """
+
+        path = self.path(namespace, key)
+        tmp = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(self.HEADER.pack(entry[2]))
+            pickle.dump(entry, f)
+        os.replace(tmp, path)
+
+        # a single thread sweeps, the other ones going on
+        if time.time() - self.swept > self.interval and self.sweeping.acquire(blocking=False):
+            try:
+                self.sweep()
+            finally:
+                self.sweeping.release()
+
+    def delete(self, namespace, key):
+        """removes an entry"""
+
+        self.__remove__(self.path(namespace, key))
+
+    def sweep(self):
+        """removes the expired entries, then the least recently written ones until the directory holds at most max_bytes, returns the number of removed files"""
+
+        self.swept = now = time.time()
+        removed = 0
+        files = []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                try:
+                    st = e.stat()
+                    # temporary files left by a writer having died
+                    if '.' in e.name:
+                        expires = st.st_mtime + self.interval
+                    else:
+                        with open(e.path, 'rb') as f:
+                            expires, = self.HEADER.unpack(f.read(self.HEADER.size))
+                except (FileNotFoundError, struct.error):
+                    continue
+                if expires < now:
+                    removed += self.__remove__(e.path)
+                else:
+                    files.append((st.st_mtime_ns, st.st_size, e.path))
+
+        size = sum(f[1] for f in files)
+        for mtime, length, path in sorted(files):
+            if size <= self.max_bytes: break
+            removed += self.__remove__(path)
+            size -= length
+
+        logger.debug('swept %s: %d files removed, %d bytes left' % (self.directory, removed, size))
+        return removed
+
+    def __remove__(self, path):
+        """Removes a file, another process may have removed it already. This method is private."""
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return 1
+
+class Namespace:
+    """
+    class giving access to the entries of a namespace of a Cache, with its own timeout.
+
+    An entry older than timeout is not returned by get() anymore, but it is
+    kept stale seconds more so that fetch() can serve it while reloading it.
+    """
+
+    def __init__(self, cache, name, timeout, stale):
+        self.cache = cache
+        self.name = name
+        self.timeout = timeout
+        self.stale = stale
+
+    def get(self, key):
+        return self.cache.get(self.name, key)
+
+    def set(self, key, value, timeout=None):
+        return self.cache.set(self.name, key, value, self.timeout if timeout is None else timeout, self.stale)
+
+    def delete(self, key):
+        return self.cache.delete(self.name, key)
+
+    def fetch(self, key, loader):
+        """returns a value with its age in seconds, calling loader when it is missing or stale
+
+        A fresh value is returned as it is. A stale value is returned at once
+        while loader runs in a background thread. A missing value waits for
+        loader. Concurrent misses of a key share the same call to loader.
+
+        >>> items = Cache().namespace('items', timeout=60)
+        >>> items.fetch('key', lambda: 'value')
+        ('value', 0)
+
+        Arguments:
+        - `key`: key of the value
+        - `loader`: function returning the value
+        """
+
+        found = self.cache.lookup(self.name, key)
+        if found is None:
+            return self.refresh(key, loader).result(), 0
+
+        value, age, fresh = found
+        if not fresh:
+            self.refresh(key, loader, background=True)
+        return value, age
+
+    def refresh(self, key, loader, background=False):
+        """calls loader to store a new value, unless it is already being called for this key, and returns its future
+
+        Arguments:
+        - `key`: key of the value
+        - `loader`: function returning the value
+        - `background`: call loader in a new thread instead of the current one
+        """
+
+        return self.cache.refresh(self.name, key, loader, self.timeout, self.stale, background)
+
+class Cache:
+    """
+    class to cache values in memory, within a budget of bytes.
+
+    Values are stored pickled, so that their size is known and that callers
+    never share mutable objects. The least recently used entries are evicted
+    once the budget is exceeded. Entries are grouped in namespaces, each one
+    having its own timeout and its hit, miss, eviction, stale and refresh
+    counters. An optional backend shares the entries with the other
+    processes, an entry kept in memory being read again when another process
+    has changed it.
+
+    >>> cache = Cache(max_bytes=1024)
+    >>> remainders = cache.namespace('remainders', timeout=60)
+    >>> remainders.set('FPR', {1: 100})
+    >>> remainders.get('FPR')
+    {1: 100}
+    >>> remainders.get('OTHER') is None
+    True
+    >>> cache.stats()['remainders']['hits'], cache.stats()['remainders']['misses']
+    (1, 1)
+    """
+
+    def __init__(self, max_bytes=64*2**20, backend=None):
+        """ctor enables to set the memory budget and the shared backend
+
+        Arguments:
+        - `max_bytes`: maximal size of the pickled values kept in memory
+        - `backend`: FileBackend shared between processes, None to keep entries local
+        """
+
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.size = 0
+        self.entries = OrderedDict()
+        self.namespaces = {}
+        self.counters = {}
+        self.loading = {}
+        self.lock = threading.RLock()
+
+    def configure(self, max_bytes=None, directory=None, directory_bytes=256*2**20):
+        """changes the memory budget and the shared directory, from the settings at startup
+
+        Arguments:
+        - `max_bytes`: maximal size of the pickled values kept in memory
+        - `directory`: directory of a FileBackend, None to keep entries local
+        - `directory_bytes`: maximal size of the files of the directory
+        """
+
+        with self.lock:
+            if max_bytes is not None: self.max_bytes = max_bytes
+            self.backend = FileBackend(directory, directory_bytes) if directory else None
+            self.__evict__()
+        return self
+
+    def namespace(self, name, timeout=5*60, stale=0):
+        """returns the namespace of a name, creating it with the given timeout and stale delay in seconds"""
+
+        with self.lock:
+            if name not in self.namespaces:
+                self.namespaces[name] = Namespace(self, name, timeout, stale)
+                self.counters[name] = {'hits': 0, 'misses': 0, 'evictions': 0, 'stale': 0, 'refreshes': 0}
+            return self.namespaces[name]
+
+    def get(self, namespace, key):
+        """returns a fresh value, None if it is missing or stale"""
+
+        found = self.lookup(namespace, key)
+        return found[0] if found is not None and found[2] else None
+
+    def lookup(self, namespace, key):
+        """returns a value with its age and whether it is fresh, None if it is missing or expired"""
+
+        now = time.time()
+        k = (namespace, key)
+        with self.lock:
+            entry = self.entries.get(k)
+            if entry is not None and entry[2] < now:
+                self.__remove__(k)
+                entry = None
+            elif entry is not None:
+                self.entries.move_to_end(k)
+
+        # the files of the backend are read without holding the lock
+        backend = self.backend
+        if backend is not None:
+            if entry is not None and backend.stamp(namespace, key) != entry[4]:
+                entry = None
+            if entry is None:
+                entry = backend.get(namespace, key)
+                with self.lock:
+                    self.__remove__(k)
+                    if entry is not None and len(entry[3]) <= self.max_bytes:
+                        self.entries[k] = entry
+                        self.size += len(entry[3])
+                        self.__evict__()
+
+        with self.lock:
+            counters = self.__get_counters__(namespace)
+            if entry is None:
+                counters['misses'] += 1
+                return None
+            fresh = now < entry[1]
+            counters['hits' if fresh else 'stale'] += 1
+
+        return pickle.loads(entry[3]), int(now - entry[0]), fresh
+
+    def set(self, namespace, key, value, timeout=5*60, stale=0):
+        """stores a value fresh for timeout seconds and kept stale seconds more, a None value removing the entry"""
+
+        if value is None:
+            return self.delete(namespace, key)
+
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        entry = (now, now + timeout, now + timeout + stale, data)
+
+        # the file is written, and the directory maybe swept, without holding the lock
+        stamp = None
+        backend = self.backend
+        if backend is not None:
+            backend.set(namespace, key, entry)
+            stamp = backend.stamp(namespace, key)
+
+        with self.lock:
+            self.__remove__((namespace, key))
+            if len(data) <= self.max_bytes:
+                self.entries[(namespace, key)] = entry + (stamp,)
+                self.size += len(data)
+                self.__evict__()
+
+    def refresh(self, namespace, key, loader, timeout=5*60, stale=0, background=False):
+        """calls loader to store a new value, unless it is already being called for this key, and returns its future
+
+        Arguments:
+        - `namespace`: namespace of the value
+        - `key`: key of the value
+        - `loader`: function returning the value
+        - `timeout`: freshness of the value in seconds
+        - `stale`: delay in seconds the value is kept once stale
+        - `background`: call loader in a new thread instead of the current one
+        """
+
+        with self.lock:
+            future = self.loading.get((namespace, key))
+            if future is not None:
+                return future
+            self.loading[(namespace, key)] = future = Future()
+            self.__get_counters__(namespace)['refreshes'] += 1
+
+        def load():
+            try:
+                value = loader()
+                self.set(namespace, key, value, timeout, stale)
+            except Exception as e:
+                logger.error('refreshing %s %s failed: %s' % (namespace, key, e))
+                future.set_exception(e)
+            else:
+                future.set_result(value)
+            finally:
+                with self.lock:
+                    del self.loading[(namespace, key)]
+
+        if background:
+            threading.Thread(target=load, daemon=True).start()
+        else:
+            load()
+        return future
+
+    def delete(self, namespace, key):
+        """removes a value"""
+
+        with self.lock:
+            self.__remove__((namespace, key))
+        if self.backend is not None:
+            self.backend.delete(namespace, key)
+
+    def stats(self):
+        """returns the counters of each namespace with the memory usage"""
+
+        with self.lock:
+            stats = {name: dict(counters) for name, counters in self.counters.items()}
+            stats['memory'] = {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+            return stats
+
+    def __get_counters__(self, namespace):
+        """Returns the counters of a namespace. This method is private."""
+
+        return self.counters.setdefault(namespace, {'hits': 0, 'misses': 0, 'evictions': 0, 'stale': 0, 'refreshes': 0})
+
+    def __remove__(self, k):
+        """Removes an entry from memory. This method is private."""
+
+        entry = self.entries.pop(k, None)
+        if entry is not None:
+            self.size -= len(entry[3])
+
+    def __evict__(self):
+        """Removes the least recently used entries until the budget is respected. This method is private."""
+
+        while self.size > self.max_bytes and self.entries:
+            (namespace, key), entry = self.entries.popitem(last=False)
+            self.size -= len(entry[3])
+            self.__get_counters__(namespace)['evictions'] += 1
+            logger.debug('evicted %s %s' % (namespace, key))
+
+cache = Cache()
@@ -0,0 +1,340 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import logging, math
+from collections import Counter
+
+logger = logging.getLogger("coins")
+
+def fewest(denominations, available, amount, reachable, budget=100000):
+    """returns the counts per denomination spending as few coins as possible, None if amount cannot be reached
+
+    Branch and bound from the largest denominations, the counts of a
+    denomination being tried from the largest one until the smaller coins
+    cannot spend fewer coins than the best selection found so far. Only
+    counts leaving a reachable amount are tried, so that when reachable is
+    exact the first selection is found without backtracking. Once budget
+    counts have been tried, the best selection found so far is returned, or
+    the preserve one if there is none.
+
+    Arguments:
+    - `denominations`: values of the coins, from the largest one
+    - `available`: number of coins per denomination
+    - `amount`: amount to reach
+    - `reachable`: function telling whether an amount can be reached from a denomination index
+    - `budget`: maximal number of counts tried
+    """
+
+    if not reachable(0, amount):
+        return None
+
+    best = [None, None]
+    counts = [0] * len(denominations)
+    tried = 0
+
+    # explicit stack of (denomination index, remaining amount, coins used, next count to try)
+    stack = [(0, amount, 0, min(available[denominations[0]], amount // denominations[0]))]
+    while stack and tried < budget:
+        i, remaining, used, count = stack.pop()
+        if remaining == 0:
+            if best[0] is None or used < best[0]:
+                best[0], best[1] = used, tuple(counts[:i]) + (0,) * (len(denominations)-i)
+            continue
+        if count < 0 or i == len(denominations):
+            continue
+
+        coin = denominations[i]
+        smaller = denominations[i+1] if i+1 < len(denominations) else coin
+        tried += 1
+
+        # spending one coin less only adds smaller coins, so the bound grows
+        if best[0] is not None and used + count - (-(remaining - count*coin) // smaller) >= best[0]:
+            continue
+
+        stack.append((i, remaining, used, count-1))
+        if reachable(i+1, remaining - count*coin):
+            counts[i] = count
+            rest = remaining - count*coin
+            following = denominations[i+1] if i+1 < len(denominations) else 1
+            stack.append((i+1, rest, used + count, min(available[following], rest // following)))
+
+    if stack:
+        logger.debug('budget of %d counts exhausted' % budget)
+        if best[1] is None:
+            return preserve(denominations, available, amount, reachable)
+    return best[1]
+
+def preserve(denominations, available, amount, reachable, budget=100000):
+    """returns the counts per denomination spending as few large coins as possible, None if amount cannot be reached
+
+    Each denomination, from the largest one, is used as little as the
+    smaller ones allow, backtracking when reachable was too optimistic.
+    None is returned as well once budget counts have been tried.
+
+    Arguments:
+    - `denominations`: values of the coins, from the largest one
+    - `available`: number of coins per denomination
+    - `amount`: amount to reach
+    - `reachable`: function telling whether an amount can be reached from a denomination index
+    - `budget`: maximal number of counts tried
+    """
+
+    if not reachable(0, amount):
+        return None
+
+    counts = [0] * len(denominations)
+    tried = 0
+
+    # explicit stack of (denomination index, remaining amount, next count to try)
+    stack = [(0, amount, 0)]
+    while stack and tried < budget:
+        i, remaining, count = stack.pop()
+        if remaining == 0:
+            return tuple(counts[:i]) + (0,) * (len(denominations)-i)
+        if i == len(denominations):
+            continue
+
+        coin = denominations[i]
+        if count > min(available[coin], remaining // coin):
+            continue
+        tried += 1
+
+        stack.append((i, remaining, count+1))
+        if reachable(i+1, remaining - count*coin):
+            counts[i] = count
+            stack.append((i+1, remaining - count*coin, 0))
+
+    logger.debug('no selection found within %d counts' % tried)
+    return None
+
+POLICIES = {'fewest': fewest, 'preserve': preserve}
+
+# maximal number of bits of the reachable amounts kept for an exact selection
+MAX_BITS = 2**24
+
+def select(amounts, amount, policy='fewest', max_bits=MAX_BITS):
+    """returns the amounts of the coins summing exactly to amount, from the largest one, None if it cannot be reached
+
+    Coins are grouped by denomination, the selection being a bounded
+    subset-sum over the denominations, divided by their greatest common
+    divisor. The amounts reachable with each denomination and the smaller
+    ones are computed first, as bit sets shifted by binary splits of the
+    number of coins, each one only covering the amounts up to the value of
+    these coins. Testing an amount then costs a byte lookup. When these bit
+    sets would take more than max_bits, the policy only prunes the amounts
+    above the value or not a multiple of the common divisor of the smaller
+    coins, and gives up once its budget is spent. The policy picks one of
+    the exact selections.
+
+    >>> select([5, 2, 2, 2], 6)
+    [2, 2, 2]
+    >>> select([10, 5, 5, 2, 1], 10)
+    [10]
+    >>> select([10, 5, 5, 2, 1], 10, policy='preserve')
+    [5, 5]
+    >>> select([5, 2], 4) is None
+    True
+    >>> select([500, 200, 200, 200], 600, max_bits=8)
+    [200, 200, 200]
+
+    Arguments:
+    - `amounts`: amounts of the coins of the wallet
+    - `amount`: amount to reach
+    - `policy`: name of a policy of POLICIES, or a function with the same arguments
+    - `max_bits`: maximal size of the bit sets of an exact selection
+    """
+
+    policy = POLICIES[policy] if isinstance(policy, str) else policy
+
+    if amount < 0 or amount > sum(amounts):
+        return None
+    if amount == 0:
+        return []
+
+    # useless coins larger than amount are left out
+    available = Counter(coin for coin in amounts if coin <= amount)
+    if not available:
+        return None
+
+    divisor = math.gcd(*available)
+    if amount % divisor:
+        return None
+    amount //= divisor
+    available = Counter({coin // divisor: count for coin, count in available.items()})
+    denominations = sorted(available, reverse=True)
+
+    # value and common divisor of the coins of denominations[i:]
+    capacity = [0] * (len(denominations)+1)
+    divisors = [0] * (len(denominations)+1)
+    for i in reversed(range(len(denominations))):
+        capacity[i] = capacity[i+1] + denominations[i]*available[denominations[i]]
+        divisors[i] = math.gcd(divisors[i+1], denominations[i])
+    limits = [min(amount, c) for c in capacity]
+
+    if sum(limits) + len(limits) <= max_bits:
+        # bit x of suffix[i] tells whether x can be reached with denominations[i:]
+        suffix = [None] * (len(denominations)+1)
+        bits = 1
+        suffix[-1] = b'\x01'
+        for i in reversed(range(len(denominations))):
+            coin, count = denominations[i], available[denominations[i]]
+            mask = (1 << (limits[i]+1)) - 1
+            chunk = 1
+            while count > 0:
+                chunk = min(chunk, count)
+                bits |= (bits << (chunk*coin)) & mask
+                count -= chunk
+                chunk *= 2
+            suffix[i] = bits.to_bytes(limits[i] // 8 + 1, 'little')
+
+        def reachable(i, remaining):
+            return 0 <= remaining <= limits[i] and suffix[i][remaining >> 3] >> (remaining & 7) & 1
+    else:
+        logger.debug('%d bits needed, selecting without them' % (sum(limits) + len(limits)))
+
+        def reachable(i, remaining):
+            return 0 <= remaining <= capacity[i] and (remaining % divisors[i] == 0 if divisors[i] else remaining == 0)
+
+    counts = policy(denominations, available, amount, reachable)
+    logger.debug('%d coins of %d denominations' % (len(amounts), len(denominations)))
+    if counts is None:
+        return None
+
+    return [coin*divisor for coin, count in zip(denominations, counts) for _ in range(count)]
+
+def denominations(maximum):
+    """returns the 1, 2 and 5 times a power of ten values up to maximum, from the smallest one
+
+    >>> denominations(60)
+    [1, 2, 5, 10, 20, 50]
+    """
+
+    values = []
+    power = 0
+    while 10**power <= maximum:
+        values.extend(base*10**power for base in [1,2,5] if base*10**power <= maximum)
+        power += 1
+    return values
+
+def split(amount):
+    """returns the fewest 1, 2 and 5 times a power of ten coins summing to amount, from the largest one
+
+    >>> split(88)
+    [50, 20, 10, 5, 2, 1]
+    """
+
+    coins = []
+    for coin in reversed(denominations(amount)):
+        count, amount = divmod(amount, coin)
+        coins.extend([coin] * count)
+    return coins
+
+def profile(amounts, keep=2):
+    """returns the coins of a compact wallet of the same balance, from the largest one
+
+    Up to keep coins of each value are kept as change, the rest of the
+    balance being made of as few 1, 2 and 5 times a power of ten coins as
+    possible.
+
+    >>> profile([1, 1, 1, 1, 1, 2, 2, 2, 5], keep=1)
+    [5, 5, 2, 2, 1, 1]
+
+    Arguments:
+    - `amounts`: amounts of the coins of the wallet
+    - `keep`: number of coins of each value kept as they are
+    """
+
+    available = Counter(amounts)
+    kept = Counter({coin: min(count, keep) for coin, count in available.items()})
+    target = kept + Counter(split(sum(amounts) - sum(coin*count for coin, count in kept.items())))
+    return sorted(target.elements(), reverse=True)
+
+def plan(amounts, keep=2):
+    """returns the transaction making a wallet compact as its type, the amounts of the coins to spend and the amounts of the coins to create, None if the wallet is already compact
+
+    A single coin to create is a fusion, several ones a divide of the spent
+    coins. Coins both in the wallet and in its compact profile are left out.
+
+    >>> plan([1, 1, 1, 1, 1, 2, 2, 2, 5], keep=1)
+    ('fusion', [2, 1, 1, 1], [5])
+    >>> plan([1, 1, 1, 1, 1, 1, 1], keep=0)
+    ('divide', [1, 1, 1, 1, 1, 1, 1], [5, 2])
+    >>> plan([10, 5, 2, 1], keep=1) is None
+    True
+
+    Arguments:
+    - `amounts`: amounts of the coins of the wallet
+    - `keep`: number of coins of each value kept as they are
+    """
+
+    target = profile(amounts, keep)
+    if len(target) >= len(amounts):
+        return None
+
+    current, target = Counter(amounts), Counter(target)
+    spent = sorted((current - target).elements(), reverse=True)
+    created = sorted((target - current).elements(), reverse=True)
+    return ('fusion' if len(created) == 1 else 'divide'), spent, created
+
+def issuable(remainders):
+    """returns every 1, 2 and 5 times a power of ten value up to the largest remainder, below 10^10, with the number of coins of this value the remainders can issue
+
+    >>> issuable({1: 7, 2: 3})
+    [(1, 10), (2, 4), (5, 1)]
+
+    Arguments:
+    - `remainders`: remainder of each amendment
+    """
+
+    # remainders of the same value are counted once
+    values = Counter(remainders.values())
+    coins = [coin for coin in denominations(max(values, default=0)) if coin < 10**10]
+    return [(coin, sum((r // coin) * n for r, n in values.items())) for coin in coins]
+
+def allocate(remainders, quantities):
+    """returns the coins to issue for each amendment as base,power strings, and the remainders left
+
+    Amendments are filled in turn, each one taking as many coins of each
+    value, from the first quantity, as its remainder and the quantity left
+    allow. The strings of a value are formatted once.
+
+    >>> allocate({1: 7, 2: 3}, [(5, 1), (2, 2), (1, 5)])
+    ({1: ['5,0', '2,0'], 2: ['2,0', '1,0']}, {1: 0, 2: 0})
+
+    Arguments:
+    - `remainders`: remainder of each amendment
+    - `quantities`: value and number of the coins to issue, from the largest value
+    """
+
+    left = [[coin, qte] for coin, qte in quantities if qte]
+    labels = {coin: '%d,%d' % (coin // 10**(len(str(coin))-1), len(str(coin))-1) for coin, qte in left}
+
+    issuances = {}
+    remaining = {}
+    for am, remainder in remainders.items():
+        issuances[am] = issuance = []
+        for quantity in left:
+            coin, qte = quantity
+            if not qte or coin > remainder: continue
+
+            count = min(remainder // coin, qte)
+            remainder -= coin*count
+            quantity[1] -= count
+            issuance.extend([labels[coin]] * count)
+        remaining[am] = remainder
+    return issuances, remaining
@@ -0,0 +1,41 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+from concurrent.futures import ThreadPoolExecutor
+
+def fanout(fct, items, limit=8):
+    """calls fct on every item with at most limit calls at the same time and returns the results in the order of items
+
+    The first exception raised by a call is raised again once every call is
+    done.
+
+    >>> fanout(lambda x: x*2, [1, 2, 3], limit=2)
+    [2, 4, 6]
+
+    Arguments:
+    - `fct`: function to call, a request to a uCoin node for instance
+    - `items`: list of arguments
+    - `limit`: maximal number of concurrent calls, 1 keeps them serial
+    """
+
+    items = list(items)
+    if limit <= 1 or len(items) <= 1:
+        return [fct(item) for item in items]
+
+    with ThreadPoolExecutor(min(limit, len(items))) as executor:
+        return list(executor.map(fct, items))
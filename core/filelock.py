@@ -0,0 +1,69 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import fcntl, threading
+
+# one thread lock per lock file, flock only excluding the other processes
+locks = {}
+locks_lock = threading.Lock()
+
+class FileLock:
+    """
+    class to lock a data file between the threads of a process and between processes.
+
+    The lock is an exclusive flock of a .lock file next to the data file,
+    taken once the threads of the process using the same file have been
+    excluded by a thread lock, flock being held per open file.
+
+    >>> import os, tempfile
+    >>> lock = FileLock(os.path.join(tempfile.mkdtemp(), 'data.json'))
+    >>> with lock: os.path.exists(lock.path)
+    True
+    """
+
+    def __init__(self, path):
+        """ctor enables to set the data file
+
+        Arguments:
+        - `path`: path of the data file, its directory having to exist when locking
+        """
+
+        self.path = path + '.lock'
+        self.file = None
+        with locks_lock:
+            self.lock = locks.setdefault(self.path, threading.Lock())
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        except:
+            if self.file is not None: self.file.close()
+            self.file = None
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        finally:
+            self.file = None
+            self.lock.release()
@@ -0,0 +1,100 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import bisect, hashlib, json, logging, re
+
+logger = logging.getLogger("keyindex")
+
+class KeyIndex:
+    """
+    class to search keys by the prefixes of the words of their uids and of their fingerprint.
+
+    Every word is kept in a sorted list, so that the words starting with a
+    prefix are a range found by bisection. The entries of the typeahead and
+    their JSON document are built once, with an etag changing with the keys.
+
+    >>> index = KeyIndex({'1234ABCD': {'fingerprint': '1234ABCD', 'uids': ['Caner Candan <caner@candan.fr>']},
+    ...                   '5678EF00': {'fingerprint': '5678EF00', 'uids': ['Alice <alice@example.org>']}})
+    >>> [x['value'] for x in index.search('can')]
+    ['1234ABCD']
+    >>> [x['value'] for x in index.search('alice exa')]
+    ['5678EF00']
+    >>> [x['value'] for x in index.search('5678')]
+    ['5678EF00']
+    """
+
+    def __init__(self, keys):
+        """ctor enables to index a keyring
+
+        Arguments:
+        - `keys`: keys by fingerprint, as returned by gnupg.GPG.list_keys
+        """
+
+        self.entries = []
+        words = []
+
+        for fingerprint in sorted(keys):
+            uids = keys[fingerprint]['uids']
+            position = len(self.entries)
+            self.entries.append({'value': fingerprint, 'fingerprint': fingerprint,
+                                 'name': uids[0] if uids else fingerprint, 'tokens': uids})
+
+            # words and whole email addresses
+            text = ' '.join(uids).lower()
+            tokens = set(re.findall(r'\w+', text)) | set(re.findall(r'[\w.+-]+@[\w.-]+', text))
+            tokens.add(fingerprint.lower())
+            words.extend((token, position) for token in tokens)
+
+        words.sort()
+        self.words = [word for word, position in words]
+        self.positions = [position for word, position in words]
+
+        self.document = json.dumps(self.entries)
+        self.etag = hashlib.sha1(self.document.encode('utf-8')).hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=10):
+        """returns the entries having, for each word of the query, a word starting with it
+
+        Entries having the most words equal to the ones of the query come
+        first, then entries by name.
+
+        Arguments:
+        - `query`: words typed by the user
+        - `limit`: maximal number of entries
+        """
+
+        found = None
+        exact = {}
+        for prefix in re.findall(r'[\w.+@-]+', query.lower()):
+            matches = set()
+            for i in range(bisect.bisect_left(self.words, prefix), len(self.words)):
+                if not self.words[i].startswith(prefix): break
+                matches.add(self.positions[i])
+                if self.words[i] == prefix:
+                    exact[self.positions[i]] = exact.get(self.positions[i], 0) + 1
+            found = matches if found is None else found & matches
+            if not found: return []
+
+        if found is None:
+            return self.entries[:limit]
+
+        ranked = sorted(found, key=lambda position: (-exact.get(position, 0), self.entries[position]['name'].lower()))
+        return [self.entries[position] for position in ranked[:limit]]
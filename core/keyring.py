@@ -0,0 +1,152 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import hashlib, json, logging, os, threading, time
+from collections.abc import Mapping
+
+logger = logging.getLogger("keyring")
+
+class Keyring:
+    """
+    class to keep on disk a snapshot of the secret and public keys listed by gpg.
+
+    A snapshot records the modification time and the size of the keyring
+    files it was listed from. It is used as long as they have not changed,
+    gpg listing the keys again otherwise. Secret and public keys have their
+    own snapshot, each one being read on first use only.
+    """
+
+    FILES = ['pubring.kbx', 'pubring.gpg', 'secring.gpg', 'trustdb.gpg', 'private-keys-v1.d']
+
+    def __init__(self, gpg, directory):
+        """ctor enables to set the GPG object listing the keys and the directory of the snapshots
+
+        Arguments:
+        - `gpg`: GPG object, or SignerStats
+        - `directory`: directory of the snapshots, created if needed
+        """
+
+        self.gpg = gpg
+        self.homedir = getattr(gpg, 'gnupghome', None) or os.environ.get('GNUPGHOME') or os.path.expanduser('~/.gnupg')
+        self.directory = directory
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, kind):
+        """returns the path of the snapshot of the secret or public keys"""
+
+        name = hashlib.sha1(os.path.abspath(self.homedir).encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.directory, 'keyring-%s-%s.json' % (name, kind))
+
+    def stamp(self):
+        """returns the modification time and the size of each keyring file, None for missing ones"""
+
+        stamp = []
+        for name in self.FILES:
+            try:
+                st = os.stat(os.path.join(self.homedir, name))
+            except FileNotFoundError:
+                stamp.append(None)
+            else:
+                stamp.append([st.st_mtime_ns, st.st_size])
+        return stamp
+
+    def keys(self, kind):
+        """returns the secret or public keys by fingerprint, from the snapshot when the keyring has not changed
+
+        Arguments:
+        - `kind`: secret or public
+        """
+
+        with self.lock:
+            if kind not in self.snapshots:
+                self.snapshots[kind] = self.__load__(kind, self.stamp())
+            return self.snapshots[kind]['keys']
+
+    def refresh(self):
+        """lists the keys of the snapshots in use again when the keyring has changed, returns whether it had"""
+
+        stamp = self.stamp()
+        with self.lock:
+            changed = [kind for kind, snapshot in self.snapshots.items() if snapshot['stamp'] != stamp]
+            for kind in changed:
+                self.snapshots[kind] = self.__load__(kind, stamp)
+        return bool(changed)
+
+    def watch(self, interval=60):
+        """refreshes the snapshots in a background thread every interval seconds"""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.refresh(): logger.info('keyring reloaded')
+                except Exception as e:
+                    logger.error('keyring refresh failed: %s' % e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def __load__(self, kind, stamp):
+        """Returns the snapshot of a kind of keys, listing them if it is missing or outdated. This method is private."""
+
+        path = self.path(kind)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+            if snapshot['stamp'] == stamp:
+                return snapshot
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        logger.debug('listing %s keys of %s' % (kind, self.homedir))
+        keys = self.gpg.list_keys(kind == 'secret')
+        snapshot = {'stamp': stamp, 'keys': {key['fingerprint']: dict(key) for key in keys}}
+
+        # the CLI and the refresh threads of the webclient may write the snapshot at once
+        tmp = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+        return snapshot
+
+class LazyKeys(Mapping):
+    """
+    class standing for the secret or public keys dict of the settings, reading the snapshot on first use.
+    """
+
+    def __init__(self, keyring, kind):
+        self.keyring = keyring
+        self.kind = kind
+
+    @property
+    def data(self):
+        """dict of the current snapshot, replaced when the keyring changes"""
+
+        return self.keyring.keys(self.kind)
+
+    def __getitem__(self, fingerprint):
+        return self.data[fingerprint]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,245 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import ucoin, json, logging, os
+from collections import OrderedDict
+from core.fanout import fanout
+from core.amendments import AmendmentChain, get_hash
+from core.filelock import FileLock
+
+logger = logging.getLogger("ledger")
+
+def dividend_issued(pgp_fingerprint, number):
+    """returns the sum of the coins a member has already issued from the dividend of an amendment
+
+    Arguments:
+    - `pgp_fingerprint`: member fingerprint
+    - `number`: amendment number
+    """
+
+    dividend_sum = 0
+    for x in ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint, number).get():
+        for coin in x['value']['transaction']['coins']:
+            base, power = coin['id'].split('-')[2:4]
+            dividend_sum += int(base) * 10**int(power)
+    return dividend_sum
+
+def issuance_numbers(item):
+    """returns the numbers of the amendments whose dividend an issuance leaf spends, as found in the ids of its coins
+
+    Arguments:
+    - `item`: leaf of the issuance merkle list of a member
+    """
+
+    numbers = set()
+    for coin in item['value']['transaction']['coins']:
+        origin = coin['id'].split('-')[4:6]
+        if len(origin) == 2 and origin[0] == 'A':
+            numbers.add(int(origin[1]))
+    return numbers
+
+class RemainderLedger:
+    """
+    class to keep on disk the dividend remainders of a wallet.
+
+    The ledger records the last amendment it has processed and the leaves
+    of the issuance merkle list of the wallet. A refresh syncs the local
+    amendment chain, reads the amendments promoted since then from it and
+    lists the issuance leaves once. The issuances of the new amendments,
+    and of the open ones touched by new leaves, are then fetched. When
+    known leaves are gone, the whole chain is processed again.
+    Local issuances are applied in place. Both reload the file first, under
+    a lock shared by the instances of a wallet in every process.
+    """
+
+    BATCHES = 32
+
+    def __init__(self, directory, pgp_fingerprint, concurrency=8):
+        """ctor enables to set the directory of the ledger files and the wallet
+
+        Arguments:
+        - `directory`: directory of the ledger files, created if needed
+        - `pgp_fingerprint`: wallet fingerprint
+        - `concurrency`: maximal number of concurrent requests
+        """
+
+        self.path = os.path.join(directory, 'remainders-%s.json' % pgp_fingerprint)
+        self.directory = directory
+        self.pgp_fingerprint = pgp_fingerprint
+        self.concurrency = concurrency
+        # refreshes run in background threads and in the processes sharing the directory
+        self.lock = FileLock(self.path)
+
+        self.last = -1
+        self.hash = None
+        self.dividends = {}
+        self.remainders = {}
+        self.batches = OrderedDict()
+        self.leaves = []
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """reads the ledger file, if any"""
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self
+
+        self.last = data['last']
+        self.hash = data.get('hash')
+        self.dividends = {int(k): v for k,v in data['dividends'].items()}
+        self.remainders = {int(k): v for k,v in data['remainders'].items()}
+        self.batches = OrderedDict(data.get('batches', []))
+        self.leaves = data.get('leaves', [])
+        return self
+
+    def save(self):
+        """writes the ledger file atomically"""
+
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'last': self.last, 'hash': self.hash, 'dividends': self.dividends, 'remainders': self.remainders,
+                       'batches': list(self.batches.items()), 'leaves': self.leaves}, f)
+        os.replace(self.path + '.tmp', self.path)
+        return self
+
+    def refresh(self):
+        """fetches the amendments promoted since the last refresh and updates the remainders"""
+
+        with self.lock:
+            return self.load().__refresh__()
+
+    def issue(self, number, amount):
+        """records a local issuance of the dividend of an amendment
+
+        Arguments:
+        - `number`: amendment number
+        - `amount`: sum of the issued coins
+        """
+
+        with self.lock:
+            return self.load().__issue__(number, amount)
+
+    def submit(self, batch, issuances, post, limit=1):
+        """posts the issuances of several amendments, recording each successful one, and returns the result of each amendment
+
+        The amendments issued by a batch are recorded with it, so that a
+        batch submitted again, after a failure or a resent form, only posts
+        the amendments not issued yet, the other ones being skipped. An
+        issuance exceeding the remainder, from a stale form for instance, is
+        not posted either. A result is issued, skipped, exceeds remainder or
+        the error of the post.
+
+        Arguments:
+        - `batch`: identifier of the batch, chosen by the caller
+        - `issuances`: coins to issue for each amendment as base,power strings
+        - `post`: function posting the issuance of an amendment, returning None or an error
+        - `limit`: maximal number of concurrent posts, 1 keeping them in amendment order
+        """
+
+        def amount(coins):
+            return sum(int(base) * 10**int(power) for base, power in (coin.split(',') for coin in coins))
+
+        def issue(number):
+            coins = issuances[number]
+            with self.lock:
+                self.load()
+                if number in self.batches.get(batch, []):
+                    return 'skipped'
+                if self.remainders.get(number, 0) < amount(coins):
+                    return 'exceeds remainder'
+
+            error = post(number, coins)
+            if error: return error
+
+            with self.lock:
+                self.load()
+                self.batches.setdefault(batch, []).append(number)
+                while len(self.batches) > self.BATCHES: self.batches.popitem(last=False)
+                self.__issue__(number, amount(coins))
+            return 'issued'
+
+        numbers = sorted(number for number, coins in issuances.items() if coins)
+        results = dict(zip(numbers, fanout(issue, numbers, limit)))
+        logger.debug('%s: batch %s %s' % (self.pgp_fingerprint, batch, results))
+        return results
+
+    def __issue__(self, number, amount):
+        """Records a local issuance, the lock being held. This method is private."""
+
+        self.remainders[number] = self.remainders.get(number, 0) - amount
+        if self.remainders[number] <= 0:
+            del self.remainders[number]
+            self.dividends.pop(number, None)
+        return self.save()
+
+    def __refresh__(self):
+        """Updates the remainders, the lock being held. This method is private."""
+
+        chain = AmendmentChain(self.directory, self.concurrency).sync()
+        if not len(chain):
+            return self
+
+        # the amendments processed so far were forked away, processing the whole chain again
+        if self.last >= len(chain) or self.last >= 0 and get_hash(chain.amendments[self.last]) != self.hash:
+            logger.warning('%s: amendment #%d was forked, processing the chain again' % (self.pgp_fingerprint, self.last))
+            self.last, self.dividends, self.remainders, self.leaves = -1, {}, {}, []
+
+        api = ucoin.hdc.transactions.sender.Issuance(self.pgp_fingerprint)
+        path = '/sender/%s/issuance' % self.pgp_fingerprint
+        leaves = api.requests_get(path, leaves='true').json()['leaves']
+
+        # an issuance gone away, the node having rolled back, may give back a closed remainder
+        if not set(self.leaves) <= set(leaves):
+            logger.warning('%s: issuances were removed, processing the chain again' % self.pgp_fingerprint)
+            self.last, self.dividends, self.remainders = -1, {}, {}
+
+        # every dividend is checked when processing the chain from the start, the leaves are only recorded
+        touched = self.__get_touched__(api, path, leaves) if self.last >= 0 else set()
+        logger.debug('%s: %d new amendments, %d open remainders, %d touched' % (self.pgp_fingerprint, len(chain)-self.last-1,
+                                                                                len(self.remainders), len(touched)))
+        self.dividends.update(chain.dividends(self.last+1))
+
+        numbers = [n for n in self.dividends if n > self.last or n in touched]
+        issued = fanout(lambda n: dividend_issued(self.pgp_fingerprint, n), numbers, self.concurrency)
+
+        for n, dividend_sum in zip(numbers, issued):
+            if self.dividends[n] > dividend_sum:
+                self.remainders[n] = self.dividends[n] - dividend_sum
+            else:
+                self.remainders.pop(n, None)
+                del self.dividends[n]
+
+        self.last = chain.current()['number']
+        self.hash = get_hash(chain.current())
+        self.leaves = leaves
+        return self.save()
+
+    def __get_touched__(self, api, path, leaves):
+        """Returns the open amendments spent by the issuance leaves not known yet. This method is private."""
+
+        known = set(self.leaves)
+        new = [leaf for leaf in leaves if leaf not in known]
+
+        items = fanout(lambda leaf: api.requests_get(path, leaf=leaf).json()['leaf'], new, self.concurrency)
+        touched = set()
+        for item in items: touched |= issuance_numbers(item)
+        return touched & set(self.remainders)
@@ -17,13 +17,162 @@
 #
 # Widely inspired from https://github.com/c-geek/merkle
 
-import hashlib, re
+import hashlib, binascii, os
+from collections import OrderedDict
 from pprint import pprint
 
+class OneShot:
+    """
+    hash backend calling the hash function once per node.
+
+    A backend hashes the uppercase hexadecimal concatenation of two children,
+    node() for a single pair and level() for every pair of a level whose
+    number of nodes is even. Backends can be sent to a process pool.
+
+    >>> OneShot().node(b'AB') == hashlib.sha1(b'AB').digest()
+    True
+    """
+
+    def __init__(self, hashfunc=hashlib.sha1):
+        """ctor enables to set the hash function
+
+        Arguments:
+        - `hashfunc`: hash function
+        """
+
+        self.hashfunc = hashfunc
+        self.width = hashfunc().digest_size
+
+    def node(self, text):
+        """returns the binary digest of the hexadecimal text of two children
+
+        Arguments:
+        - `text`: uppercase hexadecimal concatenation of two digests
+        """
+
+        return self.hashfunc(text).digest()
+
+    def level(self, leaves):
+        """returns the packed digests of each pair of leaves
+
+        Arguments:
+        - `leaves`: packed digests, their number being even
+        """
+
+        text = binascii.hexlify(leaves).upper()
+        step = 4*self.width
+        return b''.join(self.node(text[i:i+step]) for i in range(0, len(text), step))
+
+class PrefixCopy(OneShot):
+    """
+    hash backend copying a hash state prepared once instead of creating a new one per node.
+
+    >>> PrefixCopy().node(b'AB') == OneShot().node(b'AB')
+    True
+    """
+
+    def __init__(self, hashfunc=hashlib.sha1, prefix=b''):
+        """ctor enables to set the hash function and the bytes fed to every hash
+
+        Arguments:
+        - `hashfunc`: hash function
+        - `prefix`: bytes hashed before every node, none for the uCoin scheme
+        """
+
+        super().__init__(hashfunc)
+        self.prefix = prefix
+        self.state = None
+
+    def __getstate__(self):
+        """hash states cannot be pickled, the copy is prepared again after unpickling"""
+
+        return dict(self.__dict__, state=None)
+
+    def node(self, text):
+        """returns the binary digest of the hexadecimal text of two children
+
+        Arguments:
+        - `text`: uppercase hexadecimal concatenation of two digests
+        """
+
+        if self.state is None:
+            self.state = self.hashfunc(self.prefix)
+        h = self.state.copy()
+        h.update(text)
+        return h.digest()
+
+class SliceView(OneShot):
+    """
+    hash backend slicing the pairs of a level out of a memoryview instead of copying each one.
+
+    The hash function is still called once per node, as by OneShot.
+
+    >>> SliceView().level(bytes(40)) == OneShot().level(bytes(40))
+    True
+    """
+
+    def level(self, leaves):
+        """returns the packed digests of each pair of leaves
+
+        Arguments:
+        - `leaves`: packed digests, their number being even
+        """
+
+        text = memoryview(binascii.hexlify(leaves).upper())
+        step = 4*self.width
+        return b''.join([self.hashfunc(text[i:i+step]).digest() for i in range(0, len(text), step)])
+
+BACKENDS = OrderedDict([('oneshot', OneShot), ('prefix', PrefixCopy), ('view', SliceView)])
+
+def get_leaf(anydata, hashfunc=hashlib.sha1):
+    """returns the binary leaf of a string, a hexadecimal digest being kept as it is
+
+    Arguments:
+    - `anydata`: string to turn into a leaf
+    - `hashfunc`: hash function
+    """
+
+    width = hashfunc().digest_size
+    if anydata and len(anydata) == 2*width:
+        try:
+            leaf = bytes.fromhex(anydata)
+        except ValueError:
+            pass
+        else:
+            if len(leaf) == width: return leaf
+    return hashfunc(anydata.encode('ascii')).digest()
+
+def verify(root, anydata, proof, hashfunc=hashlib.sha1):
+    """checks that a string is a leaf of the tree having the given root, thanks to a proof returned by Merkle.proof
+
+    >>> tree = Merkle('abcde').process()
+    >>> verify(tree.root(), 'e', tree.proof('e'))
+    True
+    >>> verify(tree.root(), 'f', tree.proof('e'))
+    False
+
+    Arguments:
+    - `root`: hexadecimal root of the tree
+    - `anydata`: string to check
+    - `proof`: list of (side, sibling) pairs from the leaf up to the root
+    - `hashfunc`: hash function
+    """
+
+    node = binascii.hexlify(get_leaf(anydata, hashfunc)).upper().decode('ascii')
+    for side, sibling in proof:
+        text = sibling + node if side == 'L' else node + sibling
+        node = hashfunc(text.encode('ascii')).hexdigest().upper()
+    return node == root.upper()
+
 class Merkle:
     """
     class to create a Merkle Tree.
 
+    Each level is stored as a contiguous bytearray of fixed-width binary
+    digests, the uppercase hexadecimal form being only computed by root() and
+    level(). A node is still the hash of the hexadecimal concatenation of its
+    children so that roots stay the same.
+
     Here is the example we want that it works:
 
     >>> tree = Merkle('abcde').process()
@@ -35,32 +184,57 @@ class Merkle:
     4
     >>> tree.nodes()
     6
+    >>> len(tree)
+    5
     >>> tree.level(0)
     ['114B6E61CB5BB93D862CA3C1DFA8B99E313E66E9']
     >>> tree.level(1)
     ['585DD1B0A3A55D9A36DE747EC37524D318E2EBEE', '58E6B3A414A1E090DFC6029ADD0F3555CCBA127F']
     >>> tree.level(2)
     ['F4D9EEA3797499E52CC2561F722F935F10365E40', '734F7A56211B581395CB40129D307A0717538088', '58E6B3A414A1E090DFC6029ADD0F3555CCBA127F']
+
+    Levels may be hashed in parallel by passing a concurrent.futures executor,
+    only the levels having at least threshold nodes are split into chunks:
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(2) as executor:
+    ...     Merkle('abcde', executor=executor, threshold=1).process().root()
+    '114B6E61CB5BB93D862CA3C1DFA8B99E313E66E9'
+
+    Since hashlib only releases the GIL for inputs bigger than 2047 bytes, a
+    ProcessPoolExecutor is the one giving a speedup on pairs of digests.
     """
 
-    def __init__(self, strings, hashfunc=hashlib.sha1):
+    def __init__(self, strings, hashfunc=hashlib.sha1, executor=None, threshold=2**16, backend=None):
         """ctor enables to set a list of strings used to process merkle tree and set the hash function
 
         Arguments:
         - `strings`: list of strings
         - `hashfunc`: hash function
+        - `executor`: concurrent.futures executor used to hash the biggest levels, None keeps it serial
+        - `threshold`: minimal number of nodes of a level to hash it with the executor
+        - `backend`: hash backend of the nodes, OneShot(hashfunc) by default
         """
 
         self.strings = strings
         self.hashfunc = hashfunc
+        self.width = hashfunc().digest_size
+        self.backend = backend or OneShot(hashfunc)
+        self.executor = executor
+        self.threshold = threshold
 
-        self.leaves = []
+        self.leaves = bytearray()
         self.tree_depth = 0
         self.rows = []
         self.nodes_count = 0
 
         for s in strings: self.feed(s)
 
+    def __len__(self):
+        """returns the number of leaves"""
+
+        return len(self.leaves) // self.width
+
     def feed(self, anydata):
         """add a new string into leaves
 
@@ -68,11 +242,7 @@ class Merkle:
         - `anydata`: new string
         """
 
-        if anydata and re.match(r'^[\w\d]{40}$', anydata):
-            self.leaves.append(anydata.upper())
-        else:
-            self.leaves.append(self.hashfunc(anydata.encode('ascii')).hexdigest().upper())
-
+        self.leaves += self.__get_leaf__(anydata)
         return self
 
     def depth(self):
@@ -80,7 +250,7 @@ class Merkle:
 
         if not self.tree_depth:
             power = 0
-            while 2**power < len(self.leaves):
+            while 2**power < len(self):
                 power += 1
             self.tree_depth = power
 
@@ -102,18 +272,17 @@ class Merkle:
 
         d = self.depth()
         if not len(self.rows):
-            for i in range(d): self.rows.append([])
-            self.rows.append(self.leaves)
+            self.rows = [None] * d + [self.leaves]
             for i in reversed(range(d)):
                 self.rows[i] = self.__get_nodes__(self.rows[i+1])
-                self.nodes_count += len(self.rows[i])
+                self.nodes_count += len(self.rows[i]) // self.width
 
         return self
 
     def root(self):
         """returns the root node of the tree"""
 
-        return self.rows[0][0]
+        return self.level(0)[0]
 
     def level(self, i):
         """returns a level thanks to the level number passed in argument
@@ -122,7 +291,130 @@ class Merkle:
         - `i`: level number
         """
 
-        return self.rows[i]
+        step = 2*self.width
+        row = binascii.hexlify(self.rows[i]).upper().decode('ascii')
+        return [row[j:j+step] for j in range(0, len(row), step)]
+
+    def node(self, i, j):
+        """returns a node thanks to its level and position, None if there is no such node
+
+        Arguments:
+        - `i`: level number
+        - `j`: node position in the level
+        """
+
+        w = self.width
+        row = self.rows[i]
+        if not 0 <= j < len(row) // w:
+            return None
+        return binascii.hexlify(row[j*w:(j+1)*w]).upper().decode('ascii')
+
+    def diff(self, other):
+        """returns the ranges of leaf positions differing from another tree, as (begin, end) pairs
+
+        Both trees are walked from the root and identical subtrees are skipped,
+        so only O(k log n) nodes are compared for k changed leaves. The other
+        tree may be a Merkle or a MerkleView fetching its levels remotely.
+
+        >>> a = Merkle('abcdefgh').process()
+        >>> a.diff(Merkle('abcdXfgh').process())
+        [(4, 5)]
+        >>> a.diff(Merkle('abcdefghij').process())
+        [(8, 10)]
+
+        Arguments:
+        - `other`: tree to compare with
+        """
+
+        self.process()
+        count = max(len(self), len(other))
+        ranges = []
+        stack = [(max(self.depth(), other.depth()), 0)]
+
+        while stack:
+            height, j = stack.pop()
+            a = self.__get_node_at__(self, height, j)
+            b = self.__get_node_at__(other, height, j)
+            if a == b:
+                continue
+            if a is None or b is None or not height:
+                begin, end = j * 2**height, min((j+1) * 2**height, count)
+                if ranges and ranges[-1][1] == begin:
+                    begin = ranges.pop()[0]
+                ranges.append((begin, end))
+            else:
+                stack.append((height-1, 2*j+1))
+                stack.append((height-1, 2*j))
+
+        return ranges
+
+    def __get_node_at__(self, tree, height, j):
+        """Returns the node of a tree thanks to its height above the leaves, the root standing for every upper level. This method is private and used in intern from diff method.
+
+        Arguments:
+        - `tree`: Merkle or MerkleView
+        - `height`: number of levels above the leaves
+        - `j`: node position
+        """
+
+        depth = tree.depth()
+        if height > depth:
+            return tree.node(0, 0) if not j else None
+        return tree.node(depth-height, j)
+
+    def index(self, anydata):
+        """returns the index of the first leaf matching a string, raises ValueError if there is none
+
+        Arguments:
+        - `anydata`: string to look for
+        """
+
+        w = self.width
+        leaf = self.__get_leaf__(anydata)
+        leaves = self.leaves if isinstance(self.leaves, bytearray) else bytes(self.leaves)
+        i = leaves.find(leaf)
+        while i >= 0 and i % w:
+            i = leaves.find(leaf, i+1)
+        if i < 0:
+            raise ValueError('%s is not a leaf of the tree' % anydata)
+        return i // w
+
+    def proof(self, leaf_or_index):
+        """returns the inclusion proof of a leaf, the list of (side, sibling) pairs from the leaf up to the root
+
+        A side is 'L' or 'R' depending on the position of the sibling. There is
+        no pair for a level where the node is the odd one promoted as it is.
+
+        >>> Merkle('abcde').process().proof(4)
+        [('L', '585DD1B0A3A55D9A36DE747EC37524D318E2EBEE')]
+
+        Arguments:
+        - `leaf_or_index`: leaf string or leaf index
+        """
+
+        self.process()
+        index = leaf_or_index if isinstance(leaf_or_index, int) else self.index(leaf_or_index)
+        if not 0 <= index < len(self):
+            raise IndexError('leaf index out of range')
+
+        w = self.width
+        proof = []
+        for k in reversed(range(1, self.levels())):
+            sibling = index ^ 1
+            if sibling < len(self.rows[k]) // w:
+                digest = binascii.hexlify(self.rows[k][sibling*w:(sibling+1)*w]).upper().decode('ascii')
+                proof.append(('L' if sibling < index else 'R', digest))
+            index //= 2
+        return proof
+
+    def __get_leaf__(self, anydata):
+        """Returns the binary leaf of a string, a hexadecimal digest being kept as it is. This method is private and used in intern from feed method.
+
+        Arguments:
+        - `anydata`: string to turn into a leaf
+        """
+
+        return get_leaf(anydata, self.hashfunc)
 
     def __get_nodes__(self, leaves):
         """Compute nodes for a specific level. This method is private and used in intern from process method.
@@ -131,20 +423,460 @@ class Merkle:
         - `leaves`: set of nodes to process
         """
 
-        class List(list):
-            """Wrapper to enable to define what ever index you want even if the size doesnot fit yet."""
-
-            def __setitem__(self, index, value):
-                if index >= len(self):
-                    for _ in range(index-len(self)+1):
-                        self.append(None)
-                super().__setitem__(index, value)
-
-        l = len(leaves)
+        w = self.width
+        l = len(leaves) // w
         r = l % 2
-        nodes = List()
-        for i in range(0, l-1, 2):
-            nodes[int(i/2)] = self.hashfunc((leaves[i] + leaves[i+1]).encode('ascii')).hexdigest().upper()
+        nodes = bytearray(((l+r)//2) * w)
+        if self.executor is None or l < self.threshold:
+            nodes[:(l//2)*w] = self.backend.level(leaves[:(l-r)*w])
+        else:
+            # chunks hold an even number of nodes, at least a pair
+            size = max(2, max(self.threshold, l // (4*(os.cpu_count() or 1))) // 2 * 2)
+            futures = [self.executor.submit(self.backend.level, leaves[i*w:min(i+size, l-r)*w])
+                       for i in range(0, l-r, size)]
+            nodes[:(l//2)*w] = b''.join(future.result() for future in futures)
         if r == 1:
-            nodes[int((l-r)/2)] = leaves[l-1]
+            nodes[-w:] = leaves[-w:]
         return nodes
+
+class MerkleView:
+    """
+    class to read a Merkle Tree level by level, for instance from a remote node.
+
+    Each level is fetched once, when a node of it is first needed.
+
+    >>> tree = Merkle('abcde').process()
+    >>> view = MerkleView(tree.depth(), len(tree), tree.level)
+    >>> view.root() == tree.root()
+    True
+    >>> tree.diff(view)
+    []
+    """
+
+    def __init__(self, depth, count, fetch):
+        """ctor enables to set the shape of the tree and the function fetching its levels
+
+        Arguments:
+        - `depth`: depth of the tree
+        - `count`: number of leaves
+        - `fetch`: function returning the list of hexadecimal nodes of a level
+        """
+
+        self.tree_depth = depth
+        self.count = count
+        self.fetch = fetch
+        self.rows = {}
+
+    def __len__(self):
+        """returns the number of leaves"""
+
+        return self.count
+
+    def depth(self):
+        """returns the depth value"""
+
+        return self.tree_depth
+
+    def levels(self):
+        """returns the number of levels"""
+
+        return self.tree_depth+1
+
+    def root(self):
+        """returns the root node of the tree"""
+
+        return self.level(0)[0]
+
+    def level(self, i):
+        """returns a level, fetching it the first time
+
+        Arguments:
+        - `i`: level number
+        """
+
+        if i not in self.rows:
+            self.rows[i] = [x.upper() for x in self.fetch(i)]
+        return self.rows[i]
+
+    def node(self, i, j):
+        """returns a node thanks to its level and position, None if there is no such node
+
+        Arguments:
+        - `i`: level number
+        - `j`: node position in the level
+        """
+
+        row = self.level(i)
+        return row[j] if 0 <= j < len(row) else None
+
+class IncrementalMerkle(Merkle):
+    """
+    class to maintain a Merkle Tree incrementally.
+
+    Once processed, the tree keeps its rows and only re-hashes the nodes whose
+    subtree has changed: the path to the root when a leaf is updated, the right
+    side of the tree when a leaf is inserted or removed (leaves are kept in
+    order, so every following leaf moves by one slot).
+
+    >>> tree = IncrementalMerkle('abcd').process()
+    >>> tree.append('e').root()
+    '114B6E61CB5BB93D862CA3C1DFA8B99E313E66E9'
+    >>> tree.nodes()
+    6
+    >>> tree.remove(4).root() == Merkle('abcd').process().root()
+    True
+    >>> tree.insert(1, 'x').level(1) == Merkle('axbcd').process().level(1)
+    True
+    >>> tree.update(0, 'y').root() == Merkle('yxbcd').process().root()
+    True
+
+    Trees whose binary leaves are sorted, as sorted fingerprints are, can take
+    a whole batch of changes at once:
+
+    >>> tree = IncrementalMerkle(sorted('abcd', key=get_leaf)).process()
+    >>> added, removed = tree.apply(added='ef', removed='b')
+    >>> tree.root() == Merkle(sorted('acdef', key=get_leaf)).process().root()
+    True
+    """
+
+    def feed(self, anydata):
+        """add a new string into leaves
+
+        Arguments:
+        - `anydata`: new string
+        """
+
+        self.__own__()
+        return super().feed(anydata)
+
+    def append(self, anydata):
+        """adds a new string at the end of the leaves
+
+        Arguments:
+        - `anydata`: new string
+        """
+
+        self.feed(anydata)
+        return self.__rehash__(len(self)-1)
+
+    def extend(self, strings):
+        """adds several strings at the end of the leaves, re-hashing once
+
+        Arguments:
+        - `strings`: list of strings
+        """
+
+        index = len(self)
+        for s in strings: self.feed(s)
+        return self.__rehash__(index)
+
+    def insert(self, index, anydata):
+        """inserts a new string before the leaf at the given index
+
+        Arguments:
+        - `index`: leaf index
+        - `anydata`: new string
+        """
+
+        w = self.width
+        self.__own__()
+        self.leaves[index*w:index*w] = self.__get_leaf__(anydata)
+        return self.__rehash__(index)
+
+    def remove(self, index):
+        """removes the leaf at the given index
+
+        Arguments:
+        - `index`: leaf index
+        """
+
+        w = self.width
+        self.__own__()
+        del self.leaves[index*w:(index+1)*w]
+        return self.__rehash__(index)
+
+    def update(self, index, anydata):
+        """replaces the leaf at the given index
+
+        Arguments:
+        - `index`: leaf index
+        - `anydata`: new string
+        """
+
+        w = self.width
+        self.__own__()
+        self.leaves[index*w:(index+1)*w] = self.__get_leaf__(anydata)
+        return self.__rehash__(index, single=True)
+
+    def bisect(self, anydata):
+        """returns the index where anydata has to be inserted to keep sorted leaves sorted
+
+        Arguments:
+        - `anydata`: string to look for
+        """
+
+        return self.__bisect__(self.__get_leaf__(anydata))
+
+    def apply(self, added=(), removed=()):
+        """adds and removes strings of a tree whose binary leaves are sorted, re-hashing once from the first change
+
+        Returns the lists of leaves really added and really removed, strings
+        already in the tree not being added again and missing strings not
+        being removed.
+
+        Arguments:
+        - `added`: strings to add
+        - `removed`: strings to remove
+        """
+
+        w = self.width
+        removed = set(map(self.__get_leaf__, removed))
+        added = set(map(self.__get_leaf__, added)) - removed
+        if not added and not removed:
+            return [], []
+
+        self.__own__()
+        index = min(self.__bisect__(leaf) for leaf in added | removed)
+        tail = set(bytes(self.leaves[i:i+w]) for i in range(index*w, len(self.leaves), w))
+        really_added = sorted(added - tail)
+        really_removed = sorted(removed & tail)
+        self.leaves[index*w:] = b''.join(sorted((tail - removed) | added))
+        self.__rehash__(index)
+
+        hexlify = lambda leaf: binascii.hexlify(leaf).upper().decode('ascii')
+        return list(map(hexlify, really_added)), list(map(hexlify, really_removed))
+
+    def __bisect__(self, leaf):
+        """Binary search of a binary leaf in sorted leaves. This method is private and used in intern from bisect and apply methods.
+
+        Arguments:
+        - `leaf`: binary leaf
+        """
+
+        w = self.width
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if self.leaves[mid*w:(mid+1)*w] < leaf: lo = mid+1
+            else: hi = mid
+        return lo
+
+    def __own__(self):
+        """Copies the rows into bytearrays when they are read-only views, such as the memory-mapped levels of a MerkleStore. This method is private and used in intern before changing leaves."""
+
+        if isinstance(self.leaves, bytearray):
+            return
+        self.rows = [bytearray(row) for row in self.rows]
+        self.leaves = self.rows[-1] if self.rows else bytearray(self.leaves)
+
+    def __rehash__(self, index, single=False):
+        """Re-hashes the nodes covering the leaves from index. This method is private and used in intern from the update methods.
+
+        Arguments:
+        - `index`: first changed leaf
+        - `single`: only the leaf at index has changed, the other ones did not move
+        """
+
+        if not len(self.rows):
+            return self.process()
+
+        w = self.width
+        self.tree_depth = 0
+        d = self.depth()
+        old = list(reversed(self.rows))
+        rows = [self.leaves]
+
+        for k in range(1, d+1):
+            below = rows[k-1]
+            index //= 2
+            count = (len(below)//w + 1) // 2
+            row = old[k] if k < len(old) else bytearray()
+
+            if single and index < len(row)//w == count:
+                row[index*w:(index+1)*w] = self.__get_node__(below, index)
+            else:
+                row[index*w:] = self.__get_nodes__(below[2*index*w:])
+            rows.append(row)
+
+        self.rows = list(reversed(rows))
+        self.nodes_count = sum(len(row) for row in self.rows[:-1]) // w
+        return self
+
+    def __get_node__(self, leaves, j):
+        """Compute a single node of the level above leaves. This method is private and used in intern from __rehash__ method.
+
+        Arguments:
+        - `leaves`: set of nodes to process
+        - `j`: index of the node to compute
+        """
+
+        w = self.width
+        if (2*j+2)*w <= len(leaves):
+            return self.backend.node(binascii.hexlify(leaves[2*j*w:(2*j+2)*w]).upper())
+        return leaves[2*j*w:(2*j+1)*w]
+
+class StreamingMerkle:
+    """
+    class to compute the root of a Merkle Tree from a stream of strings.
+
+    Only the roots of the complete subtrees built so far are kept, at most one
+    per height as the bits of a binary counter, so that memory stays in
+    O(log n) whatever the number of leaves. The odd nodes being promoted, the
+    root is obtained by folding these subtrees from the right.
+
+    >>> tree = StreamingMerkle().consume(iter('abcde'))
+    >>> tree.root()
+    '114B6E61CB5BB93D862CA3C1DFA8B99E313E66E9'
+    >>> len(tree), tree.depth()
+    (5, 3)
+
+    When a spool directory is given, every level is written there as packed
+    digests while the leaves are fed, so that levels can be read afterwards:
+
+    >>> import tempfile
+    >>> tree = StreamingMerkle(spool=tempfile.mkdtemp()).consume('abcde')
+    >>> tree.level(1)
+    ['585DD1B0A3A55D9A36DE747EC37524D318E2EBEE', '58E6B3A414A1E090DFC6029ADD0F3555CCBA127F']
+    """
+
+    def __init__(self, hashfunc=hashlib.sha1, backend=None, spool=None):
+        """ctor enables to set the hash function and the directory where levels are written
+
+        Arguments:
+        - `hashfunc`: hash function
+        - `backend`: hash backend of the nodes, OneShot(hashfunc) by default
+        - `spool`: directory where levels are written, None to keep only the root
+        """
+
+        self.hashfunc = hashfunc
+        self.width = hashfunc().digest_size
+        self.backend = backend or OneShot(hashfunc)
+        self.spool = spool
+        self.files = {}
+        self.finished = False
+
+        self.pending = []
+        self.count = 0
+
+    def __len__(self):
+        """returns the number of leaves"""
+
+        return self.count
+
+    def feed(self, anydata):
+        """add a new string into leaves
+
+        Arguments:
+        - `anydata`: new string
+        """
+
+        node = get_leaf(anydata, self.hashfunc)
+        height = 0
+        self.__write__(height, node)
+
+        while self.pending and self.pending[-1][0] == height:
+            left = self.pending.pop()[1]
+            node = self.__get_node__(left, node)
+            height += 1
+            self.__write__(height, node)
+
+        self.pending.append((height, node))
+        self.count += 1
+        return self
+
+    def consume(self, strings):
+        """add every string of an iterable into leaves
+
+        Arguments:
+        - `strings`: iterable of strings, a generator for instance
+        """
+
+        for s in strings: self.feed(s)
+        return self
+
+    def depth(self):
+        """computes and returns the depth value"""
+
+        power = 0
+        while 2**power < self.count:
+            power += 1
+        return power
+
+    def levels(self):
+        """returns the number of levels"""
+
+        return self.depth()+1
+
+    def root(self):
+        """returns the root node of the tree"""
+
+        node = self.__get_partial__(len(self.pending))
+        return binascii.hexlify(node).upper().decode('ascii')
+
+    def level(self, i):
+        """returns a level read from the spool directory, ending the stream
+
+        Arguments:
+        - `i`: level number
+        """
+
+        if self.spool is None:
+            raise ValueError('levels are only kept with a spool directory')
+
+        self.finish()
+        step = 2*self.width
+        with open(self.__get_path__(self.depth()-i), 'rb') as f:
+            row = binascii.hexlify(f.read()).upper().decode('ascii')
+        return [row[j:j+step] for j in range(0, len(row), step)]
+
+    def finish(self):
+        """writes the last node of each level, the one covering the leaves not forming a complete subtree"""
+
+        if self.finished or self.spool is None:
+            return self
+        self.finished = True
+
+        for height in range(1, self.depth()+1):
+            if self.count % 2**height:
+                pending = [node for h, node in self.pending if h < height]
+                self.__write__(height, self.__get_partial__(len(pending), pending))
+
+        for f in self.files.values(): f.close()
+        return self
+
+    def __get_partial__(self, count, pending=None):
+        """Folds from the right the count last pending subtrees. This method is private and used in intern from root and finish methods.
+
+        Arguments:
+        - `count`: number of subtrees to fold
+        - `pending`: digests of the subtrees, the pending ones by default
+        """
+
+        if pending is None:
+            pending = [node for h, node in self.pending]
+        if not count:
+            raise IndexError('there is no leaf')
+
+        node = pending[-1]
+        for left in reversed(pending[len(pending)-count:-1]):
+            node = self.__get_node__(left, node)
+        return node
+
+    def __get_node__(self, left, right):
+        """Compute the parent of two nodes. This method is private and used in intern from feed method."""
+
+        return self.backend.node(binascii.hexlify(left + right).upper())
+
+    def __get_path__(self, height):
+        """Returns the path of the file of a level. This method is private."""
+
+        return os.path.join(self.spool, 'level-%d' % height)
+
+    def __write__(self, height, node):
+        """Appends a node to the file of its level when there is a spool directory. This method is private and used in intern from feed and finish methods."""
+
+        if self.spool is None:
+            return
+        if height not in self.files:
+            self.files[height] = open(self.__get_path__(height), 'wb')
+        self.files[height].write(node)
@@ -0,0 +1,76 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import requests, logging
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("session")
+
+class Session(requests.Session):
+    """
+    class to share keep-alive connections between every request sent to uCoin nodes.
+
+    Each host has its own pool of at most pool_maxsize connections, and a
+    request waits for a free connection instead of opening a new one. A
+    default timeout is applied to requests not giving their own.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, timeout=30, max_retries=0):
+        """ctor enables to set the limits of the connection pools
+
+        Arguments:
+        - `pool_connections`: number of hosts whose pools are kept
+        - `pool_maxsize`: maximal number of connections per host
+        - `timeout`: default timeout in seconds
+        - `max_retries`: number of retries of failed connections
+        """
+
+        super().__init__()
+        self.timeout = timeout
+
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              max_retries=max_retries,
+                              pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+def install(ucoin):
+    """makes every call of the ucoin API go through a shared session configured by ucoin.settings
+
+    The ucoin resources call requests.get and requests.post, so the session
+    takes the place of the requests module in the ucoin package.
+
+    Arguments:
+    - `ucoin`: ucoin package
+    """
+
+    session = Session(pool_connections=ucoin.settings.get('pool_connections', 10),
+                      pool_maxsize=ucoin.settings.get('pool_maxsize', 10),
+                      timeout=ucoin.settings.get('timeout', 30),
+                      max_retries=ucoin.settings.get('max_retries', 0))
+
+    logger.debug('http session: %d hosts, %d connections per host, %ss timeout' %
+                 (ucoin.settings.get('pool_connections', 10), ucoin.settings.get('pool_maxsize', 10), session.timeout))
+
+    ucoin.requests = session
+    return session
@@ -0,0 +1,93 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import logging, threading, time
+from collections import deque
+
+logger = logging.getLogger("signer")
+
+class SignerStats:
+    """
+    class to time the signatures of a GPG object, for the stats of the webclient.
+
+    It stands for the GPG object: it is installed as ucoin.settings['gpg'],
+    times sign() and calls every other method on the wrapped object. The
+    latency of the last signatures is kept for the stats. Nothing is pooled
+    or batched: each signature still runs its own gpg process.
+
+    >>> class Stub:
+    ...     def sign(self, data, **kwargs): return data.upper()
+    ...     def list_keys(self, secret=False): return []
+    >>> signer = SignerStats(Stub())
+    >>> [signer.sign(data, detach=True) for data in ['a', 'b', 'c']]
+    ['A', 'B', 'C']
+    >>> signer.list_keys(True)
+    []
+    >>> signer.stats()['signatures']
+    3
+    """
+
+    def __init__(self, gpg, history=1000):
+        """ctor enables to set the GPG object and how many latencies are kept
+
+        Arguments:
+        - `gpg`: GPG object
+        - `history`: number of latencies kept for the stats
+        """
+
+        self.gpg = gpg
+        self.latencies = deque(maxlen=history)
+        self.signatures = 0
+        self.lock = threading.Lock()
+
+    def sign(self, data, **kwargs):
+        """signs a document with the GPG object
+
+        Arguments:
+        - `data`: document to sign
+        - `kwargs`: arguments of gnupg.GPG.sign, detach and keyid for instance
+        """
+
+        start = time.perf_counter()
+        signature = self.gpg.sign(data, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.signatures += 1
+        logger.debug('signed %d bytes in %.3fs' % (len(data), elapsed))
+        return signature
+
+    def stats(self):
+        """returns the number of signatures and the latencies of the last ones in milliseconds"""
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {'signatures': self.signatures}
+
+        if latencies:
+            stats.update({'mean': 1000 * sum(latencies) / len(latencies),
+                          'p50': 1000 * latencies[len(latencies) // 2],
+                          'p95': 1000 * latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)],
+                          'max': 1000 * latencies[-1]})
+        return stats
+
+    def __getattr__(self, name):
+        """Returns the other attributes of the GPG object. This method is private."""
+
+        return getattr(self.gpg, name)
@@ -0,0 +1,104 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import copy, logging, threading, types
+from concurrent.futures import Future
+
+logger = logging.getLogger("singleflight")
+
+class SingleFlight:
+    """
+    class to share the result of a call between the threads doing the same call at the same time.
+
+    The first thread calling a key runs the call, the others wait for its
+    result instead of sending the same request to the uCoin node. Nothing is
+    kept once the call is done: a later call runs again. Generators are
+    turned into lists, to be shared, and waiting threads get their own copy
+    of the result.
+
+    >>> flights = SingleFlight()
+    >>> flights.do('Current', 'key', lambda: {'number': 1})
+    {'number': 1}
+    >>> flights.stats()['Current']
+    {'calls': 1, 'coalesced': 0}
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def do(self, name, key, fct):
+        """returns the result of fct, shared with the concurrent calls of the same key
+
+        Arguments:
+        - `name`: name of the endpoint, counters are kept per name
+        - `key`: hashable identifying the call within the endpoint
+        - `fct`: function doing the call
+        """
+
+        with self.lock:
+            call = self.calls.get((name, key))
+            leader = call is None
+            if leader:
+                self.calls[(name, key)] = call = [Future(), 0]
+            else:
+                call[1] += 1
+            counters = self.counters.setdefault(name, {'calls': 0, 'coalesced': 0})
+            counters['calls' if leader else 'coalesced'] += 1
+
+        if not leader:
+            logger.debug('%s %s coalesced' % (name, key))
+            return copy.deepcopy(call[0].result())
+
+        try:
+            result = fct()
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+        except BaseException as e:
+            with self.lock:
+                del self.calls[(name, key)]
+            call[0].set_exception(e)
+            raise
+
+        with self.lock:
+            del self.calls[(name, key)]
+        call[0].set_result(result)
+
+        # the waiting threads copy the result, which must stay untouched
+        return copy.deepcopy(result) if call[1] else result
+
+    def get(self, resource, **kwargs):
+        """calls the get method of a ucoin resource, shared with the concurrent calls of the same resource
+
+        Arguments:
+        - `resource`: ucoin resource, ucoin.pks.All() for instance
+        - `kwargs`: arguments of get
+        """
+
+        name = '%s.%s' % (type(resource).__module__, type(resource).__name__)
+        key = (repr(sorted(vars(resource).items())), repr(sorted(kwargs.items())))
+        return self.do(name, key, lambda: resource.get(**kwargs))
+
+    def stats(self):
+        """returns the calls done and the calls coalesced of each endpoint"""
+
+        with self.lock:
+            return {name: dict(counters) for name, counters in self.counters.items()}
+
+flights = SingleFlight()
@@ -0,0 +1,110 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import hashlib, mmap, os, struct
+from core.merkle import IncrementalMerkle
+
+class MerkleStore:
+    """
+    class to save Merkle Trees on disk, one file per amendment number.
+
+    A file is made of a header followed by every level, from the root to the
+    leaves, as packed binary digests. Loading a tree maps the file in memory
+    and uses its levels as they are, without hashing anything.
+
+    >>> import tempfile
+    >>> store = MerkleStore(tempfile.mkdtemp(), 'members')
+    >>> store.save(0, IncrementalMerkle('abcde').process())
+    >>> store.load(0).root()
+    '114B6E61CB5BB93D862CA3C1DFA8B99E313E66E9'
+    >>> store.load(1) is None
+    True
+    """
+
+    MAGIC = b'UPYM'
+    HEADER = struct.Struct('>4sBQB')
+
+    def __init__(self, directory, name, hashfunc=hashlib.sha1):
+        """ctor enables to set the directory containing the files and the name of the trees
+
+        Arguments:
+        - `directory`: directory of the files, created if needed
+        - `name`: name of the trees, members or voters for instance
+        - `hashfunc`: hash function of the trees
+        """
+
+        self.directory = directory
+        self.name = name
+        self.hashfunc = hashfunc
+
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, number):
+        """returns the path of the file of an amendment
+
+        Arguments:
+        - `number`: amendment number
+        """
+
+        return os.path.join(self.directory, '%s-%d.merkle' % (self.name, number))
+
+    def save(self, number, tree):
+        """writes the levels of a tree, replacing the previous file atomically
+
+        Arguments:
+        - `number`: amendment number
+        - `tree`: Merkle tree
+        """
+
+        tree.process()
+        path = self.path(number)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, tree.width, len(tree), tree.depth()))
+            for row in tree.rows: f.write(row)
+        os.replace(path + '.tmp', path)
+
+    def load(self, number):
+        """returns the tree of an amendment with memory-mapped levels, None if it was not saved
+
+        Arguments:
+        - `number`: amendment number
+        """
+
+        try:
+            f = open(self.path(number), 'rb')
+        except FileNotFoundError:
+            return None
+
+        with f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        magic, width, count, depth = self.HEADER.unpack(data[:self.HEADER.size])
+        if magic != self.MAGIC or width != self.hashfunc().digest_size:
+            raise ValueError('%s is not a merkle file of this hash function' % self.path(number))
+
+        tree = IncrementalMerkle([], self.hashfunc)
+        offset = self.HEADER.size
+        for k in range(depth+1):
+            size = ((count + 2**(depth-k) - 1) // 2**(depth-k)) * width
+            tree.rows.append(data[offset:offset+size])
+            offset += size
+
+        tree.leaves = tree.rows[-1]
+        tree.tree_depth = depth
+        tree.nodes_count = sum(len(row) for row in tree.rows[:-1]) // width
+        return tree
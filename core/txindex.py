@@ -0,0 +1,129 @@
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+# Caner Candan <caner@candan.fr>, http://caner.candan.fr
+#
+
+import ucoin, json, logging, os, sqlite3
+from core.fanout import fanout
+
+logger = logging.getLogger("txindex")
+
+class TransactionIndex:
+    """
+    class to index locally the transactions sent and received by a wallet.
+
+    Transactions are stored in a SQLite database, indexed by direction, type
+    and signature date, so that a page of the history is a range query.
+    Transactions are merkle leaves on uCoin nodes: a sync fetches the list of
+    leaf hashes and only downloads the leaves not indexed yet.
+    """
+
+    DIRECTIONS = ['sender', 'recipient']
+
+    def __init__(self, directory, pgp_fingerprint, concurrency=8):
+        """ctor enables to set the directory of the databases and the wallet
+
+        Arguments:
+        - `directory`: directory of the databases, created if needed
+        - `pgp_fingerprint`: wallet fingerprint
+        - `concurrency`: maximal number of concurrent requests
+        """
+
+        self.pgp_fingerprint = pgp_fingerprint
+        self.concurrency = concurrency
+
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'transactions-%s.sqlite' % pgp_fingerprint))
+
+        # lets pages be read while a background sync is writing
+        self.db.execute('PRAGMA journal_mode=WAL')
+
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS transactions (
+                direction TEXT, hash TEXT, type TEXT, sigDate INTEGER, value TEXT,
+                PRIMARY KEY (direction, hash))''')
+            # one index per page query shape, each one read in sigDate order without sorting
+            self.db.execute('''CREATE INDEX IF NOT EXISTS transactions_date
+                ON transactions (direction, type, sigDate DESC)''')
+            self.db.execute('''CREATE INDEX IF NOT EXISTS transactions_all_date
+                ON transactions (direction, sigDate DESC)''')
+
+    def close(self):
+        self.db.close()
+
+    def sync(self, direction):
+        """downloads the transactions of a direction not indexed yet, returns their number
+
+        Arguments:
+        - `direction`: sender or recipient
+        """
+
+        api = ucoin.hdc.transactions.Sender(self.pgp_fingerprint) if direction == 'sender'\
+              else ucoin.hdc.transactions.Recipient(self.pgp_fingerprint)
+        path = '/%s/%s' % (direction, self.pgp_fingerprint)
+
+        leaves = api.requests_get(path, leaves='true').json()['leaves']
+        known = set(row[0] for row in self.db.execute('SELECT hash FROM transactions WHERE direction = ?', (direction,)))
+        missing = [leaf for leaf in leaves if leaf not in known]
+        logger.debug('%s %s: %d transactions, %d to fetch' % (self.pgp_fingerprint, direction, len(leaves), len(missing)))
+
+        items = fanout(lambda leaf: api.requests_get(path, leaf=leaf).json()['leaf'], missing, self.concurrency)
+
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?)',
+                                [(direction, item['hash'], item['value']['transaction']['type'].upper(),
+                                  item['value']['transaction']['sigDate'], json.dumps(item))
+                                 for item in items])
+        return len(missing)
+
+    def sync_all(self):
+        """downloads the sent and received transactions not indexed yet"""
+
+        for direction in self.DIRECTIONS: self.sync(direction)
+        return self
+
+    def count(self, direction, type='all'):
+        """returns the number of indexed transactions
+
+        Arguments:
+        - `direction`: sender or recipient
+        - `type`: transaction type, all for every type
+        """
+
+        where, args = self.__get_where__(direction, type)
+        return self.db.execute('SELECT COUNT(*) FROM transactions WHERE ' + where, args).fetchone()[0]
+
+    def page(self, direction, type='all', offset=0, limit=10):
+        """returns transactions from the latest signed ones, as returned by the node
+
+        Arguments:
+        - `direction`: sender or recipient
+        - `type`: transaction type, all for every type
+        - `offset`: number of transactions to skip
+        - `limit`: maximal number of transactions
+        """
+
+        where, args = self.__get_where__(direction, type)
+        rows = self.db.execute('SELECT value FROM transactions WHERE ' + where +
+                               ' ORDER BY sigDate DESC LIMIT ? OFFSET ?', args + (limit, offset))
+        return [json.loads(row[0]) for row in rows]
+
+    def __get_where__(self, direction, type):
+        """Returns the condition selecting a direction and a type. This method is private."""
+
+        if type == 'all':
+            return 'direction = ?', (direction,)
+        return 'direction = ? AND type = ?', (direction, type.upper())
@@ -21,37 +21,33 @@ from pprint import pprint
 import\
     ucoin, json, logging, argparse, sys,\
     gnupg, hashlib, re, datetime as dt,\
-    webbrowser, math
+    webbrowser, math, uuid, threading
 from collections import OrderedDict
 from flask import\
     Flask, request, render_template,\
     jsonify, redirect, abort, url_for,\
-    flash, Blueprint
+    flash, Blueprint, Response
 from flask.views import MethodView
 from io import StringIO
-from werkzeug.contrib.cache import SimpleCache
+from core.cache import cache
+from core.coins import select, issuable, allocate
+from core.singleflight import flights
+from core.ledger import RemainderLedger
+from core.txindex import TransactionIndex
+from core.keyindex import KeyIndex
 
 logger = logging.getLogger("wallets")
 
 bp = Blueprint('wallets', __name__, static_folder='static', template_folder='templates')
-cache = SimpleCache()
-
-def compute_dividend_remainders(pgp_fingerprint):
-    remainders = {}
-    for am in ucoin.hdc.amendments.List().get():
-        if not am['dividend']: continue
-        if not am['dividend']: continue
-        dividend_sum = 0
-        for x in ucoin.hdc.transactions.sender.issuance.Dividend(pgp_fingerprint, am['number']).get():
-            __sum = 0
-            for coin in x['value']['transaction']['coins']:
-                base, power = coin['id'].split('-')[2:4]
-                __sum += int(base) * 10**int(power)
-            dividend_sum += __sum
-
-        if am['dividend'] > dividend_sum:
-            remainders[int(am['number'])] = am['dividend'] - dividend_sum
-    return remainders
+remainders_cache = cache.namespace('remainders', timeout=5*60, stale=60*60)
+synced_cache = cache.namespace('transactions_synced', timeout=5*60, stale=60*60)
+
+def get_ledger(pgp_fingerprint):
+    return RemainderLedger(ucoin.settings.get('data', 'data'), pgp_fingerprint,
+                           ucoin.settings.get('concurrency', 8))
+
+def get_remainders(pgp_fingerprint):
+    return dict(get_ledger(pgp_fingerprint).refresh().remainders)
 
 @bp.app_template_filter('split')
 def split_filter(s, sep=' '):
@@ -80,14 +76,17 @@ def new_create():
     newkey = ucoin.settings['gpg'].gen_key(__input)
     return jsonify(result="Your new key (%s) has been successfully created." % newkey.fingerprint)
 
-def get_transactions(pgp_fingerprint, fct, key_prefix, begin=None, end=None):
-    k = '%s_transactions_%s' % (key_prefix, pgp_fingerprint)
-    v = cache.get(k)
-    if v is None:
-        v = list(fct(pgp_fingerprint, begin=begin, end=end).get())
-        v.sort(key=lambda x: x['value']['transaction']['sigDate'], reverse=True)
-        cache.set(k, v, timeout=5*60)
-    return v
+def get_transactions(pgp_fingerprint):
+    return TransactionIndex(ucoin.settings.get('data', 'data'), pgp_fingerprint,
+                            ucoin.settings.get('concurrency', 8))
+
+def sync_transactions(pgp_fingerprint):
+    index = get_transactions(pgp_fingerprint)
+    try:
+        index.sync_all()
+    finally:
+        index.close()
+    return True
 
 from math import ceil
 
@@ -136,32 +135,35 @@ def url_for_other_page(page):
 @bp.route('/<pgp_fingerprint>/history/page/<int:page>')
 @bp.route('/<pgp_fingerprint>/history/<type>/page/<int:page>')
 def history(pgp_fingerprint, type='all', page=1):
-    recipient = get_transactions(pgp_fingerprint, ucoin.hdc.transactions.Recipient, 'recipient')
-    sender = get_transactions(pgp_fingerprint, ucoin.hdc.transactions.Sender, 'sender')
-    count = max(len(recipient), len(sender))
+    synced, age = synced_cache.fetch(pgp_fingerprint, lambda: sync_transactions(pgp_fingerprint))
+
+    index = get_transactions(pgp_fingerprint)
+    count = max(index.count('recipient', type), index.count('sender', type))
 
     begin = (page-1)*PER_PAGE
-    end = begin+(PER_PAGE-1)
 
     pagination = Pagination(page, PER_PAGE, count)
 
+    recipient = index.page('recipient', type, begin, PER_PAGE)
+    sender = index.page('sender', type, begin, PER_PAGE)
+    index.close()
+
     return render_template('wallets/history.html',
                            settings=ucoin.settings,
                            key=ucoin.settings['secret_keys'].get(pgp_fingerprint),
-                           recipient=recipient[begin:end],
-                           sender=sender[begin:end],
+                           recipient=recipient,
+                           sender=sender,
                            pagination=pagination,
-                           type=type, page=page,
-                           clist=ucoin.wrappers.coins.List(pgp_fingerprint)())
+                           type=type, page=page, age=age,
+                           clist=flights.do('coins.List', pgp_fingerprint, ucoin.wrappers.coins.List(pgp_fingerprint)))
 
 @bp.route('/<pgp_fingerprint>/history/refresh')
 @bp.route('/<pgp_fingerprint>/history/refresh/<type>')
 @bp.route('/<pgp_fingerprint>/history/refresh/page/<int:page>')
 @bp.route('/<pgp_fingerprint>/history/refresh/<type>/page/<int:page>')
 def history_refresh(pgp_fingerprint, type='all', page=1):
-    k = 'sender_transactions_%s' % pgp_fingerprint; cache.set(k, None)
-    k = 'recipient_transactions_%s' % pgp_fingerprint; cache.set(k, None)
-    flash(u'History refreshed', 'info')
+    synced_cache.refresh(pgp_fingerprint, lambda: sync_transactions(pgp_fingerprint), background=True)
+    flash(u'History is being refreshed', 'info')
     return redirect(url_for('.history', pgp_fingerprint=pgp_fingerprint, type=type, page=page))
 
 @bp.route('/<pgp_fingerprint>/transfer', methods=['GET', 'POST'])
@@ -175,8 +177,6 @@ def transfer(pgp_fingerprint):
                                clist=(balance,__clist))
 
     amounts = [x['amount'] for x in __clist]
-    amounts.sort()
-    amounts.reverse()
 
     recipient = request.form.get('recipient')
     amount = request.form.get('amount', type=int)
@@ -190,15 +190,9 @@ def transfer(pgp_fingerprint):
         flash('amount is higher than available balance (%d > %d).' % (amount, balance), 'error')
         return redirect(url_for('.transfer', pgp_fingerprint=pgp_fingerprint))
 
-    coins = []
-    total = 0
-    for coin in amounts:
-        if total >= amount: break
-        if total+coin <= amount:
-            coins.append(coin)
-            total += coin
+    coins = select(amounts, amount, ucoin.settings.get('coin_policy', 'fewest'))
 
-    if sum(coins) != amount:
+    if coins is None:
         flash('this amount cannot be reached with existing coins in your wallet.', 'error')
         return redirect(url_for('.transfer', pgp_fingerprint=pgp_fingerprint))
 
@@ -213,14 +207,30 @@ def transfer(pgp_fingerprint):
 
     return redirect(url_for('.transfer', pgp_fingerprint=pgp_fingerprint))
 
+key_index = {'keys': None, 'count': 0, 'index': None}
+key_index_lock = threading.Lock()
+
+def get_key_index():
+    """returns the index of the public keys, built again when the keyring has been reloaded or has changed"""
+
+    keys = ucoin.settings['public_keys']
+    keys = getattr(keys, 'data', keys) # dict of the current keyring snapshot
+    with key_index_lock:
+        if key_index['keys'] is not keys or key_index['count'] != len(keys):
+            key_index.update(keys=keys, count=len(keys), index=KeyIndex(keys))
+        return key_index['index']
+
 @bp.route('/public_keys')
 def public_keys():
-    keys = ucoin.settings['public_keys']
-    for k,v in keys.items():
-        v['value'] = v['fingerprint']
-        v['tokens'] = v['uids']
-        v['name'] = v['uids'][0]
-    return json.dumps(list(keys.values()))
+    index = get_key_index()
+
+    if request.args.get('q'):
+        return Response(json.dumps(index.search(request.args['q'], request.args.get('limit', 10, type=int))),
+                        mimetype='application/json')
+
+    response = Response(index.document, mimetype='application/json')
+    response.set_etag(index.etag)
+    return response.make_conditional(request)
 
 @bp.route('/contacts')
 def contacts():
@@ -229,11 +239,11 @@ def contacts():
 
 @bp.route('/<pgp_fingerprint>/issuance', methods=['GET', 'POST'])
 def issuance(pgp_fingerprint):
-    k = 'remainders_%s' % pgp_fingerprint
-    remainders = cache.get(k)
-    if remainders is None:
-        remainders = compute_dividend_remainders(pgp_fingerprint)
-        cache.set(k, remainders, timeout=5*60)
+    remainders, age = remainders_cache.fetch(pgp_fingerprint, lambda: get_remainders(pgp_fingerprint))
+
+    # issuing from stale remainders would be rejected by the node
+    if request.method == 'POST' and remainders_cache.get(pgp_fingerprint) is None:
+        remainders, age = remainders_cache.refresh(pgp_fingerprint, lambda: get_remainders(pgp_fingerprint)).result(), 0
 
     if not remainders:
         return render_template('wallets/no_issuance.html',
@@ -243,57 +253,40 @@ def issuance(pgp_fingerprint):
     remainder = sum(remainders.values())
     max_remainder = max(remainders.values()) if remainders.values() else 0
 
-    def count_coins(coin):
-        count = 0
-        for r in remainders.values():
-            if r >= coin: count += int(r/coin)
-        return count
-
-    coins = []
-    for power in range(10):
-        for base in [1,2,5]:
-            coin = base*(10**power)
-            if coin > max_remainder: break
-            coins.append((coin,count_coins(coin)))
+    coins = issuable(remainders)
 
     if request.method == 'GET':
         return render_template('wallets/issuance.html',
                                settings=ucoin.settings,
                                key=ucoin.settings['secret_keys'].get(pgp_fingerprint),
                                remainders=remainders, remainder=remainder,
-                               max_remainder=max_remainder, coins=coins)
+                               max_remainder=max_remainder, coins=coins, age=age,
+                               batch=uuid.uuid4().hex)
 
     quantities = []
     for coin, count in reversed(coins):
         qte = request.form.get('coin_%d' % coin, type=int)
         if qte: quantities.append((coin, qte))
 
-    issuances = {}
-
-    for am in remainders:
-        issuances[am] = issuance = []
+    issuances = allocate(remainders, quantities)[0]
 
-        for i in range(len(quantities)):
-            coin, qte = quantities[i]
-            if not qte: continue
-
-            if coin <= remainders[am]:
-                new_qte = int(remainders[am]/coin)
-                if new_qte > qte: new_qte = qte
-                remainders[am] -= coin*new_qte
-                quantities[i] = (coin,qte-new_qte)
-
-                for i in range(new_qte):
-                    power = int(math.log10(coin))
-                    issuance.append('%d,%d' % (coin/10**power, power))
-
-    for am, coins in issuances.items():
+    def post(am, coins):
         issue = ucoin.wrappers.transactions.Issue(pgp_fingerprint, am, coins)
-        if not issue():
-            flash(u'Issuance error', 'error')
-            return redirect(url_for('.issuance', pgp_fingerprint=pgp_fingerprint))
-
-    flash('The issuance was completed.', 'success')
-    cache.set(k, None)
+        if not issue(): return issue.get_error() or 'Issuance error'
+
+    ledger = get_ledger(pgp_fingerprint)
+    results = ledger.submit(request.form.get('batch') or uuid.uuid4().hex, issuances, post,
+                            ucoin.settings.get('issuance_concurrency', 1))
+    remainders_cache.set(pgp_fingerprint, dict(ledger.remainders))
+
+    # amendments already issued by this batch are not reported again
+    for am, result in results.items():
+        if result == 'exceeds remainder':
+            flash(u'Amendment #%d was not issued: the coins exceed its remainder, which has changed since the form was displayed.' % am, 'error')
+        elif result not in ['issued', 'skipped']:
+            flash(u'Issuance error on amendment #%d: %s' % (am, result), 'error')
+
+    issued = list(results.values()).count('issued')
+    if issued: flash('The issuance was completed for %d amendments.' % issued, 'success')
 
     return redirect(url_for('.issuance', pgp_fingerprint=pgp_fingerprint))
@@ -21,21 +21,23 @@ from pprint import pprint
 import\
     ucoin, json, logging, argparse, sys,\
     gnupg, hashlib, re, datetime as dt,\
-    webbrowser, math, core
+    webbrowser, math, core, core.session
 from collections import OrderedDict
 from flask import\
     Flask, request, render_template,\
     jsonify, redirect, abort, url_for,\
     flash
 from io import StringIO
-from werkzeug.contrib.cache import SimpleCache
+from core.cache import cache
+from core.singleflight import flights
+from core.signer import SignerStats
+from core.keyring import Keyring, LazyKeys
 import api, wallets
 
 logger = logging.getLogger("cli")
 
 app = Flask(__name__)
 app.secret_key = 'some_secret'
-cache = SimpleCache()
 
 app.register_blueprint(api.bp, url_prefix='/api')
 app.register_blueprint(wallets.bp, url_prefix='/wallets')
@@ -44,6 +46,18 @@ app.register_blueprint(wallets.bp, url_prefix='/wallets')
 def home():
     return redirect(url_for('wallets.home'))
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/flights/stats')
+def flights_stats():
+    return jsonify(flights.stats())
+
+@app.route('/signer/stats')
+def signer_stats():
+    return jsonify(ucoin.settings['gpg'].stats())
+
 if __name__ == '__main__':
     common_options = {'formatter_class': argparse.ArgumentDefaultsHelpFormatter}
 
@@ -114,23 +128,24 @@ if __name__ == '__main__':
 
     if ucoin.settings.get('user'):
         logger.debug('selected keyid: %s' % ucoin.settings['user'])
-        ucoin.settings['gpg'] = gpg = gnupg.GPG(options=['-u %s' % ucoin.settings['user']])
+        ucoin.settings['gpg'] = gpg = SignerStats(gnupg.GPG(options=['-u %s' % ucoin.settings['user']]))
 
-        secret_keys = gpg.list_keys(True)
-        public_keys = gpg.list_keys()
-
-        for idx, fp in enumerate(secret_keys.fingerprints):
+        keyring = Keyring(gpg, ucoin.settings.get('data', 'data'))
+        for fp, key in keyring.keys('secret').items():
             if fp[-8:] == ucoin.settings['user']:
-                ucoin.settings.update(secret_keys[idx])
+                ucoin.settings.update(key)
                 break
 
-        ucoin.settings['secret_keys'] = __secret_keys = {}
-        ucoin.settings['public_keys'] = __public_keys = {}
-
-        for k in secret_keys: __secret_keys[k['fingerprint']] = k
-        for k in public_keys: __public_keys[k['fingerprint']] = k
+        ucoin.settings['secret_keys'] = LazyKeys(keyring, 'secret')
+        ucoin.settings['public_keys'] = LazyKeys(keyring, 'public')
+        keyring.watch(ucoin.settings.get('keyring_refresh', 60))
     else:
-        ucoin.settings['gpg'] = gpg = gnupg.GPG()
+        ucoin.settings['gpg'] = gpg = SignerStats(gnupg.GPG())
+
+    core.session.install(ucoin)
+    cache.configure(max_bytes=ucoin.settings.get('cache_size', 64)*2**20,
+                    directory=ucoin.settings.get('cache_dir'),
+                    directory_bytes=ucoin.settings.get('cache_dir_size', 256)*2**20)
 
     ucoin.settings.update(ucoin.ucg.Peering().get())
 